@@ -0,0 +1,92 @@
+# Compares the per-pixel bitmap drawing path with the current one, drawing
+# with spans on a plain frame buffer and blitting on a framebuf FrameBuffer.
+# Usage: python -m benchmarks.bitmap
+import time
+
+from decal import draw, ComputedStyle, Color, BitMap, BitMapBox, InstrumentedFrameBuffer
+from decal.framebuffer import FrameBuffer, RGB565
+
+class CountingFrameBuffer:
+    def __init__(self):
+        self.calls = 0
+
+    def pixel(self, x, y, c=None):
+        self.calls += 1
+
+    def hline(self, x, y, w, c):
+        self.calls += 1
+
+    def fill_rect(self, x, y, w, h, c):
+        self.calls += 1
+
+    def text(self, s, x, y, c=1):
+        self.calls += 1
+
+    def blit(self, source, x, y, key=-1, palette=None):
+        self.calls += 1
+
+def blit_framebuffer():
+    # Counts calls by primitive, passing blits through to the FrameBuffer
+    return InstrumentedFrameBuffer(FrameBuffer(bytearray(64 * 64 * 2), 64, 64, RGB565))
+
+def calls(framebuf):
+    if isinstance(framebuf, InstrumentedFrameBuffer):
+        return sum(framebuf.calls.values()), framebuf.calls.get('blit', 0)
+
+    return framebuf.calls, 0
+
+def per_pixel(box, framebuf):
+    for dx, dy, bit in box.bitmap:
+        pixel = box.style.foreground_color if bit else box.style.background_color
+
+        if pixel != Color.TRANSPARENT:
+            framebuf.pixel(box.position.x + dx, box.position.y + dy, pixel)
+
+def measure(fn, framebuffer, box, repeat):
+    framebuf = framebuffer()
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        fn(box, framebuf)
+
+    elapsed = time.perf_counter() - start
+    total, blits = calls(framebuf)
+    return total // repeat, blits // repeat, elapsed / repeat * 1e6
+
+def circle(size):
+    buffer = bytearray(size * size // 8)
+    r = size // 2
+
+    for x in range(size):
+        for y in range(size):
+            if (x - r) ** 2 + (y - r) ** 2 <= r * r:
+                buffer[(y // 8) * size + x] |= 1 << (y % 8)
+
+    return BitMap(bytes(buffer), width=size)
+
+def main(repeat=200):
+    icon = circle(32)
+
+    cases = [
+        ('32x32', icon, ComputedStyle()),
+        ('32x32 opaque', icon, ComputedStyle(background_color=Color.BLACK)),
+        ('32x32 scaled x2', icon.scale(2), ComputedStyle()),
+    ]
+
+    paths = (
+        ('per-pixel', per_pixel, CountingFrameBuffer),
+        ('draw', draw, CountingFrameBuffer),
+        ('draw blit', draw, blit_framebuffer),
+    )
+
+    print(f'{"case":<20}{"path":<12}{"calls":>8}{"blits":>8}{"us/draw":>12}')
+
+    for name, bitmap, style in cases:
+        box = BitMapBox(style, bitmap)
+
+        for path, fn, framebuffer in paths:
+            total, blits, elapsed = measure(fn, framebuffer, box, repeat)
+            print(f'{name:<20}{path:<12}{total:>8}{blits:>8}{elapsed:>12.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Reports memory allocated per box for a laid out menu, comparing the
+# slotted box classes with equivalents carrying an instance __dict__.
+# Usage: python -m benchmarks.memory
+import gc
+
+from decal import (
+    ComputedStyle,
+    Align,
+    BoxSizing,
+    Percentage,
+    Position,
+    Dimensions,
+    Viewport,
+    BlockBox,
+    InlineBox,
+    TextBox)
+from decal.layout import measure_cache
+
+try:
+    import tracemalloc
+except ImportError:
+    # MicroPython
+    tracemalloc = None
+
+class font:
+    @staticmethod
+    def width(text):
+        return len(text) * 6
+
+    @staticmethod
+    def height(text):
+        return 8
+
+item_style = ComputedStyle.shorthand(padding=2, width=Percentage(100), box_sizing=BoxSizing.BORDER, font=font)
+value_style = ComputedStyle.shorthand(align=Align.END, font=font)
+
+class DictPosition(Position):
+    __slots__ = ('__dict__',)
+
+class DictDimensions(Dimensions):
+    __slots__ = ('__dict__',)
+
+class DictBlockBox(BlockBox):
+    __slots__ = ('__dict__',)
+
+class DictInlineBox(InlineBox):
+    __slots__ = ('__dict__',)
+
+class DictTextBox(TextBox):
+    __slots__ = ('__dict__',)
+
+def with_dict(box):
+    box.position = DictPosition(0, 0)
+    box.dimensions = DictDimensions(0, 0)
+    return box
+
+def menu(rows, block, inline, text, wrap):
+    return wrap(block(ComputedStyle(), [
+        wrap(inline(item_style, [
+            wrap(text(item_style, f'Row {i}')),
+            wrap(inline(value_style, [wrap(text(value_style, str(i)))]))
+        ]))
+        for i in range(rows)]))
+
+def allocated(fn):
+    gc.collect()
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = fn()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        before = gc.mem_alloc()
+        result = fn()
+        size = gc.mem_alloc() - before
+
+    return result, size
+
+def main(rows=100):
+    variants = (
+        ('slots', BlockBox, InlineBox, TextBox, lambda box: box),
+        ('dict', DictBlockBox, DictInlineBox, DictTextBox, with_dict),
+    )
+
+    boxes = 1 + rows * 4
+    print(f'{"variant":<10}{"boxes":>8}{"tree bytes/box":>16}{"layout bytes/box":>18}')
+
+    for name, block, inline, text, wrap in variants:
+        tree, tree_size = allocated(lambda: menu(rows, block, inline, text, wrap))
+        viewport = Viewport(Position(0, 0), Dimensions(128, 64), [tree])
+        measure_cache.clear()
+        _, layout_size = allocated(viewport.layout)
+
+        print(f'{name:<10}{boxes:>8}{tree_size / boxes:>16.1f}{layout_size / boxes:>18.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Measures how ParallelRenderer scales with the number of workers, on
+# threads and on processes. Prints one JSON object per mode, workers and
+# operation with the wall time per screen.
+# Usage: python -m benchmarks.parallel [screens] > results.jsonl
+import json
+import os
+import sys
+import time
+
+from decal import Position, Dimensions, Viewport
+from decal.parallel import ParallelRenderer
+
+from .render import menu
+
+def viewport(rows):
+    return Viewport(Position(0, 0), Dimensions(256, rows * 12 + 2), [menu(rows)])
+
+def timed(fn, screens):
+    start = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - start) * 1000000 / screens, 1)
+
+def main(screens=16):
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+
+    for processes in (False, True):
+        for workers in counts:
+            with ParallelRenderer(workers, processes=processes) as renderer:
+                # Starts the workers before timing
+                list(renderer.render_many([viewport(1)]))
+
+                laid_out = viewport(40)
+                laid_out.layout()
+                results = {
+                    'render': timed(lambda: [renderer.render(laid_out) for _ in range(screens)], screens),
+                    'render_many': timed(lambda: list(renderer.render_many(
+                        [viewport(40) for _ in range(screens)], chunksize=2)), screens)
+                }
+
+            for operation, us in results.items():
+                print(json.dumps({'mode': 'processes' if renderer.processes else 'threads',
+                    'workers': workers, 'operation': operation, 'screens': screens, 'us': us}))
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,190 @@
+# Measures layout, diff, draw and update times of parameterised scenarios.
+# Prints one JSON object per scenario and phase with the wall time, bytes
+# allocated and frame buffer calls per frame, for tracking regressions.
+# Usage: python -m benchmarks.render [frames] > results.jsonl
+import gc
+import json
+import sys
+import time
+
+from decal import (
+    ComputedStyle,
+    Color,
+    BorderStyle,
+    Align,
+    BoxSizing,
+    Percentage,
+    Position,
+    Dimensions,
+    Viewport,
+    Decal,
+    draw,
+    block,
+    inline,
+    bitmap)
+from decal.layout import measure_cache
+from decal.ui import diff_tree
+
+from .bitmap import CountingFrameBuffer, circle
+
+try:
+    import tracemalloc
+except ImportError:
+    # MicroPython
+    tracemalloc = None
+
+class font:
+    @staticmethod
+    def width(text):
+        return len(text) * 6
+
+    @staticmethod
+    def height(text):
+        return 8
+
+root_style = ComputedStyle.shorthand(padding_top=2)
+item_style = ComputedStyle.shorthand(padding=2, width=Percentage(100), box_sizing=BoxSizing.BORDER, font=font)
+selected_style = ComputedStyle.shorthand(background_color=Color.WHITE, foreground_color=Color.BLACK,
+    padding=2, width=Percentage(100), box_sizing=BoxSizing.BORDER, font=font)
+value_style = ComputedStyle.shorthand(align=Align.END, font=font)
+level_style = ComputedStyle.shorthand(padding_left=2, border=(1, BorderStyle.SOLID, Color.WHITE), font=font)
+icon_style = ComputedStyle()
+
+def menu(rows, values=None):
+    return block(root_style, [
+        inline(selected_style if i == 0 else item_style, [
+            f'Row {i}',
+            inline(value_style, [str(values[i] if values is not None else i)])
+        ], key=i)
+        for i in range(rows)])
+
+def nested(depth):
+    # Alternates blocks and full width inlines, each level with a label
+    children = []
+
+    for i in range(depth, 0, -1):
+        if i % 2:
+            children = [block(level_style, [f'Level {i}'] + children)]
+        else:
+            children = [inline(item_style, [f'Level {i}', block(level_style, children)])]
+
+    return children[0]
+
+def icon(image):
+    return block(root_style, [bitmap(icon_style, image)])
+
+def viewport(height):
+    return Viewport(Position(0, 0), Dimensions(128, height), [])
+
+def clock():
+    if hasattr(time, 'perf_counter'):
+        return time.perf_counter()
+
+    return time.ticks_us() / 1e6
+
+def allocated(fn):
+    gc.collect()
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        fn()
+        size = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        before = gc.mem_alloc()
+        fn()
+        size = gc.mem_alloc() - before
+
+    return size
+
+def measure(frame, frames, framebuf=None):
+    # Runs frame once for warm up and allocations, then frames times for time and calls
+    bytes_allocated = allocated(frame)
+
+    if framebuf is not None:
+        framebuf.calls = 0
+
+    start = clock()
+
+    for _ in range(frames):
+        frame()
+
+    elapsed = clock() - start
+
+    return {
+        'us': round(elapsed / frames * 1e6, 1),
+        'bytes': bytes_allocated,
+        'calls': framebuf.calls // frames if framebuf is not None else 0,
+    }
+
+def static(build, height, frames):
+    # Layout of a new tree, diff of two equal trees and a full draw
+    results = {}
+    framebuf = CountingFrameBuffer()
+    view = viewport(height)
+
+    def layout():
+        view.children = [build()]
+        view.layout()
+
+    results['layout'] = measure(layout, frames)
+
+    other = viewport(height)
+    other.children = [build()]
+    other.layout()
+
+    results['diff'] = measure(lambda: diff_tree(view.children, other.children), frames)
+    results['draw'] = measure(lambda: draw(view, framebuf), frames, framebuf)
+
+    return results
+
+def update(rows, percent, frames):
+    # Decal updates changing the value of percent of the rows, redrawing the damage
+    framebuf = CountingFrameBuffer()
+    view = viewport(rows * 12 + 2)
+    render = Decal(view, damage=True)
+    values = list(range(rows))
+    changed = max(rows * percent // 100, 1)
+    state = {'row': 0}
+
+    for _ in render(menu(rows, values)):
+        pass
+
+    def frame():
+        for _ in range(changed):
+            values[state['row']] += 1
+            state['row'] = (state['row'] + 1) % rows
+
+        for rect in render(menu(rows, values)):
+            framebuf.fill_rect(rect.x, rect.y, rect.width, rect.height, Color.BLACK)
+            draw(view, framebuf, clip=rect)
+
+    return {'update': measure(frame, frames, framebuf)}
+
+def scenarios(frames):
+    for rows in (10, 100):
+        yield 'menu', {'rows': rows}, static(lambda: menu(rows), rows * 12 + 2, frames)
+
+    for depth in (8, 32):
+        yield 'nested', {'depth': depth}, static(lambda: nested(depth), 16 * depth, frames)
+
+    for size, scale in ((64, 1), (128, 1), (128, 4)):
+        image = circle(size // scale).scale(scale) if scale > 1 else circle(size)
+        yield 'bitmap', {'size': size, 'scale': scale}, static(lambda: icon(image), size, frames)
+
+    for rows in (10, 100):
+        for percent in (1, 10, 100):
+            yield 'update', {'rows': rows, 'percent': percent}, update(rows, percent, frames)
+
+def main(frames=20):
+    measure_cache.clear()
+
+    for name, params, results in scenarios(frames):
+        for phase, result in results.items():
+            record = {'scenario': name, 'phase': phase}
+            record.update(params)
+            record.update(result)
+            print(json.dumps(record))
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -11,11 +11,20 @@ from .layout import (
     Percentage,
     Position,
     Dimensions,
+    Rect,
     Viewport,
     Box,
     BlockBox,
+    ListBox,
     InlineBox,
     TextBox,
     BitMapBox)
-from .ui import Decal, block, inline, text, bitmap
+from .cache import Cache
+from .profile import Profiler, InstrumentedFrameBuffer
+from .schedule import Scheduler
+from .ui import Decal, block, inline, text, bitmap, virtual_list, scroll_into_view
 from .draw import draw
+from .font import BitMapFont
+from .display import DisplayList, display_list, cached_display_list
+from .band import BandRenderer
+from .stream import regions
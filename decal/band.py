@@ -0,0 +1,111 @@
+# Renders a viewport through a strip buffer one band or tile at a time, for
+# displays whose full frame buffer does not fit in RAM. Each finished band is
+# passed to a sink, e.g. writing it to a window of the display over SPI.
+
+from .draw import draw
+from .layout import Color, Rect
+
+try:
+    import framebuf as _framebuf
+except ImportError:
+    from . import framebuffer as _framebuf
+
+class OffsetFrameBuffer:
+    # Draws at absolute coordinates into a frame buffer covering the area at
+    # x, y. Other attributes are passed through.
+    def __init__(self, target, x=0, y=0):
+        self.target = target
+        self.x = x
+        self.y = y
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def fill(self, c):
+        self.target.fill(c)
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return self.target.pixel(x - self.x, y - self.y)
+
+        self.target.pixel(x - self.x, y - self.y, c)
+
+    def hline(self, x, y, w, c):
+        self.target.hline(x - self.x, y - self.y, w, c)
+
+    def vline(self, x, y, h, c):
+        self.target.vline(x - self.x, y - self.y, h, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        self.target.fill_rect(x - self.x, y - self.y, w, h, c)
+
+    def rect(self, x, y, w, h, c, *args):
+        self.target.rect(x - self.x, y - self.y, w, h, c, *args)
+
+    def text(self, s, x, y, c=1):
+        self.target.text(s, x - self.x, y - self.y, c)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        if palette is None:
+            self.target.blit(fbuf, x - self.x, y - self.y, key)
+        else:
+            self.target.blit(fbuf, x - self.x, y - self.y, key, palette)
+
+def buffer_size(width, height, format):
+    if format == _framebuf.RGB565:
+        return width * height * 2
+
+    if format == _framebuf.MONO_HLSB:
+        return (width + 7) // 8 * height
+
+    return width * ((height + 7) // 8)
+
+class BandRenderer:
+    # Draws bands of band_height rows, split into tiles of tile_width columns
+    # if given, into a buffer of their size. sink(buffer, x, y, width, height)
+    # receives the pixels of each drawn window in the given format.
+    def __init__(self, sink, width, band_height, format=_framebuf.RGB565, tile_width=None, buffer=None):
+        self.sink = sink
+        self.band_height = band_height
+        self.tile_width = tile_width or width
+        self.format = format
+        self.buffer = buffer or bytearray(buffer_size(self.tile_width, band_height, format))
+        self.view = memoryview(self.buffer)
+
+    def windows(self, viewport, rects=None):
+        # Windows of the bands touched by rects, or all bands. Only the
+        # bounding rectangle of the damage within a band is drawn.
+        bounds = viewport.border_box()
+
+        for y in range(bounds.y, bounds.y + bounds.height, self.band_height):
+            for x in range(bounds.x, bounds.x + bounds.width, self.tile_width):
+                band = Rect(x, y, self.tile_width, self.band_height).intersection(bounds)
+
+                if rects is None:
+                    yield band
+                    continue
+
+                window = None
+
+                for rect in rects:
+                    rect = rect.intersection(band)
+
+                    if rect is not None:
+                        window = rect if window is None else window.union(rect)
+
+                if window is not None:
+                    yield window
+
+    def render(self, viewport, rects=None, background=Color.BLACK):
+        # Draws and sinks the bands touched by rects, returns the drawn windows
+        drawn = []
+
+        for window in self.windows(viewport, rects):
+            target = _framebuf.FrameBuffer(self.buffer, window.width, window.height, self.format)
+            target.fill(background)
+            draw(viewport, OffsetFrameBuffer(target, window.x, window.y), clip=window)
+            size = buffer_size(window.width, window.height, self.format)
+            self.sink(self.view[:size], window.x, window.y, window.width, window.height)
+            drawn.append(window)
+
+        return drawn
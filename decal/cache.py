@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+class Cache:
+    # Least recently used cache bounded by the total size of its entries.
+    # Sizes are given by the caller, e.g. bytes for buffers or 1 for a count bound.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def __repr__(self):
+        return f'Cache({self.capacity}, size={self.size}, hits={self.hits}, misses={self.misses})'
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def get(self, key, default=None):
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            self.misses += 1
+            return default
+
+        # Reinsert to mark as most recently used
+        self.entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size=1):
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= entry[1]
+
+        if size <= self.capacity:
+            self.entries[key] = (value, size)
+            self.size += size
+            self.evict()
+
+        return value
+
+    def resize(self, capacity):
+        self.capacity = capacity
+        self.evict()
+
+    def evict(self):
+        while self.size > self.capacity:
+            key = next(iter(self.entries))
+            self.size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,537 @@
+# Display lists record the drawing operations of a laid out tree in a flat array,
+# to be replayed onto any frame buffer without walking the tree again.
+from array import array
+
+from . import profile
+from .cache import Cache
+from .draw import fill, background_rect, border_rects, draw_string, draw_bitmap, text_area
+from .layout import Color, Rect, Viewport, ListBox, TextBox, BitMapBox
+
+# Operations are stored as FIELDS integers: operation, x, y, width, height, color and background.
+# Font and text pairs and bitmaps are kept in a list of references alongside, None for other operations.
+FILL = 0
+TEXT = 1
+BITMAP = 2
+CLIP = 3
+UNCLIP = 4
+RING = 5
+FIELDS = 7
+
+# Display lists of screens keyed by the caller, bounded by number of operations.
+display_cache = Cache(1024)
+
+def index_of(box, siblings):
+    for i in range(len(siblings)):
+        if siblings[i] is box:
+            return i
+
+    return None
+
+def path_step(box, index):
+    # Keyed boxes are identified by their key, the others by their index
+    return (box.key,) if box.key is not None else index
+
+def box_path(box, roots):
+    # Path of the box from the roots, None if it is not part of their trees
+    path = []
+
+    while True:
+        siblings = box.parent.children if box.parent is not None else roots
+        index = index_of(box, siblings)
+
+        if index is None:
+            return None
+
+        path.append(path_step(box, index))
+
+        if box.parent is None:
+            break
+
+        box = box.parent
+
+    path.reverse()
+    return tuple(path)
+
+def box_at(path, roots):
+    # Box at a path from the roots, None if there is none
+    box = None
+    siblings = roots
+
+    for step in path:
+        if isinstance(step, tuple):
+            box = None
+
+            for child in siblings:
+                if child.key == step[0]:
+                    box = child
+                    break
+        else:
+            box = siblings[step] if step < len(siblings) else None
+
+        if box is None:
+            return None
+
+        siblings = getattr(box, 'children', ())
+
+    return box
+
+def shares_key(box, roots):
+    # Siblings sharing a key share their path
+    if box.key is None:
+        return False
+
+    siblings = box.parent.children if box.parent is not None else roots
+    return sum(1 for sibling in siblings if sibling.key == box.key) > 1
+
+class DisplayList:
+    # Operations of boxes are stored in drawing order, the operations of a subtree
+    # being contiguous. Their ranges are kept by path of the box to patch them.
+    def __init__(self, bounds=None):
+        self.bounds = bounds
+        self.ops = array('i')
+        self.refs = []
+        self.ranges = {}
+        self.roots = []
+        # Pixels saved by optimized
+        self.saved = 0
+
+    def __repr__(self):
+        return f'DisplayList({len(self)} operations)'
+
+    def __len__(self):
+        return len(self.refs)
+
+    def clear(self):
+        self.ops = array('i')
+        self.refs = []
+        self.ranges = {}
+        self.roots = []
+
+    def emit(self, op, x, y, width, height, color=0, background=0, ref=None):
+        self.ops.extend((op, x, y, width, height, color, background))
+        self.refs.append(ref)
+
+    def record(self, box, path):
+        start = len(self)
+        style = box.style
+
+        if isinstance(box, TextBox):
+            if style.foreground_color != Color.TRANSPARENT:
+                self.emit(TEXT, box.position.x, box.position.y, *text_area(style.font, box.text),
+                    style.foreground_color, 0, (style.font, box.text))
+
+            decoration = box.decoration()
+
+            if decoration is not None:
+                self.emit(FILL, *decoration, style.text_decoration_color)
+        elif isinstance(box, BitMapBox):
+            if style.foreground_color != Color.TRANSPARENT or style.background_color != Color.TRANSPARENT:
+                self.emit(BITMAP, box.position.x, box.position.y, box.bitmap.width, box.bitmap.height,
+                    style.foreground_color, style.background_color, box.bitmap)
+        else:
+            rect = background_rect(box)
+
+            if rect is not None:
+                self.emit(FILL, *rect)
+
+            for rect in border_rects(box):
+                self.emit(FILL, *rect)
+
+            if isinstance(box, ListBox):
+                # Keeps the path to follow the list when it is moved along with its parent
+                self.emit(CLIP, *box.border_box(), 0, 0, path)
+
+            for i, child in enumerate(box.children):
+                self.record(child, path + (path_step(child, i),))
+
+            if isinstance(box, ListBox):
+                self.emit(UNCLIP, 0, 0, 0, 0)
+
+        self.ranges[path] = (start, len(self))
+
+    def compile(self, roots):
+        self.clear()
+        self.roots = list(roots)
+
+        for i, root in enumerate(self.roots):
+            self.record(root, (path_step(root, i),))
+
+    def patch(self, new, old):
+        # Replaces the operations of box old with the ones of box new at the same path.
+        # Returns False if old is not part of the recorded trees, shares its path with a
+        # sibling of the same key, or drew nothing at the same operation as another box
+        # drawing nothing, as their order can not be told apart then.
+        path = box_path(old, self.roots)
+        span = self.ranges.get(path)
+
+        if span is None or shares_key(old, self.roots):
+            return False
+
+        start, end = span
+        patch = DisplayList()
+        patch.record(new, path)
+        depth = len(path)
+
+        if start == end:
+            for key, (first, last) in self.ranges.items():
+                if first == last == start and key[:depth] != path and path[:len(key)] != key:
+                    return False
+
+        if len(patch) == end - start:
+            self.ops[start * FIELDS:end * FIELDS] = patch.ops
+        else:
+            self.ops = self.ops[:start * FIELDS] + patch.ops + self.ops[end * FIELDS:]
+            shift = len(patch) - (end - start)
+
+            # Ranges of enclosing and following boxes, the ones of the box and its
+            # descendants are replaced below. Enclosing ranges may start at the same
+            # operation as the box, and end at the same one if it drew nothing.
+            for key, (first, last) in self.ranges.items():
+                if key[:depth] == path:
+                    continue
+
+                if path[:len(key)] == key:
+                    self.ranges[key] = (first, last + shift)
+                elif first >= end and last > start:
+                    self.ranges[key] = (first + shift, last + shift)
+
+        self.refs[start:end] = patch.refs
+
+        for key in [key for key in self.ranges if key[:depth] == path]:
+            del self.ranges[key]
+
+        for key, (first, last) in patch.ranges.items():
+            self.ranges[key] = (first + start, last + start)
+
+        return True
+
+    def update(self, viewport, updates):
+        # Patches the operations of changed boxes after a Decal update,
+        # recompiling when boxes were inserted or removed.
+        for new, old in updates:
+            if new is None or old is None or new is viewport or not self.patch(new, old):
+                self.compile(viewport.children)
+                return
+
+        self.roots = list(viewport.children)
+        self.update_clips()
+
+    def update_clips(self):
+        # Containers drawing nothing are not reported when they move,
+        # the clips of lists within them are moved along
+        ops = self.ops
+
+        for i in range(len(self.refs)):
+            j = i * FIELDS
+
+            if ops[j] == CLIP:
+                box = box_at(self.refs[i], self.roots)
+
+                if box is not None:
+                    rect = box.border_box()
+                    ops[j + 1] = rect.x
+                    ops[j + 2] = rect.y
+                    ops[j + 3] = rect.width
+                    ops[j + 4] = rect.height
+
+    def replay(self, framebuf, clip=None):
+        profiler = profile.profiler
+
+        if profiler is None:
+            self.replay_ops(framebuf, clip)
+            return
+
+        start = profiler.start()
+        self.replay_ops(framebuf, clip)
+        profiler.stop('draw', start)
+
+    def replay_ops(self, framebuf, clip=None):
+        if self.bounds is not None:
+            clip = self.bounds if clip is None else clip.intersection(self.bounds)
+
+            if clip is None:
+                return
+
+        ops = self.ops
+        refs = self.refs
+        clips = []
+
+        for i in range(len(refs)):
+            j = i * FIELDS
+            op = ops[j]
+            x = ops[j + 1]
+            y = ops[j + 2]
+            width = ops[j + 3]
+            height = ops[j + 4]
+
+            if op == CLIP:
+                clips.append(clip)
+                rect = Rect(x, y, width, height)
+                clip = rect if clip is None else clip.intersection(rect) or Rect(x, y, 0, 0)
+                continue
+
+            if op == UNCLIP:
+                clip = clips.pop()
+                continue
+
+            if clip is not None and not (clip.x < x + width and
+                    x < clip.x + clip.width and
+                    clip.y < y + height and
+                    y < clip.y + clip.height):
+                continue
+
+            if op == FILL:
+                fill(framebuf, x, y, width, height, ops[j + 5], clip)
+            elif op == TEXT:
+                draw_string(framebuf, *refs[i], x, y, ops[j + 5], clip)
+            elif op == BITMAP:
+                draw_bitmap(framebuf, refs[i], x, y, ops[j + 5], ops[j + 6], clip)
+            elif op == RING:
+                if clip is None or clip.contains(Rect(x, y, width, height)):
+                    framebuf.rect(x, y, width, height, ops[j + 5])
+                else:
+                    for side in ring_sides(Rect(x, y, width, height)):
+                        fill(framebuf, *side, ops[j + 5], clip)
+
+    def clipped(self, rect):
+        # Copy of the operations touching rect, clipped to it. The copy keeps no
+        # boxes, so it can be pickled for other processes but not patched.
+        bounds = rect if self.bounds is None else rect.intersection(self.bounds)
+        display = DisplayList(bounds or Rect(rect.x, rect.y, 0, 0))
+        ops = self.ops
+
+        for i in range(len(self.refs)):
+            j = i * FIELDS
+            op, x, y, width, height = ops[j:j + 5]
+
+            if (op == CLIP or op == UNCLIP or
+                    (x < rect.x + rect.width and rect.x < x + width and
+                    y < rect.y + rect.height and rect.y < y + height)):
+                display.emit(*ops[j:j + FIELDS], self.refs[i])
+
+        return display
+
+    def optimized(self, background=None):
+        # Copy drawing fewer pixels in fewer calls. Borders of width 1 become rings,
+        # fills covered by later opaque operations are dropped or shrunk, fills in the
+        # background color the frame buffer was cleared to are dropped unless drawing
+        # over other operations and adjacent fills of the same color are merged. The number of pixels not
+        # filled anymore is kept in saved. The copy can not be patched.
+        items = self.analyze()
+        before = fill_pixels(items)
+        items = merge_rings(items)
+        items = remove_overdraw(items)
+
+        if background is not None:
+            items = remove_background(items, background)
+
+        merge_fills(items)
+
+        display = DisplayList(self.bounds)
+        display.saved = before - fill_pixels(items)
+
+        for op, rect, visible, context, color, background, ref in items:
+            display.emit(op, *rect, color, background, ref)
+
+        return display
+
+    def analyze(self):
+        # Operations as lists of operation, rectangle, visible part of the rectangle,
+        # clip context, colors and reference, without invisible ones.
+        # Fills are clipped to the static clip of the viewport and lists.
+        items = []
+        clip = self.bounds
+        clips = []
+        contexts = [-1]
+
+        for i in range(len(self)):
+            j = i * FIELDS
+            op, x, y, width, height, color, background = self.ops[j:j + FIELDS]
+            rect = Rect(x, y, width, height)
+
+            if op == CLIP:
+                clips.append(clip)
+                contexts.append(i)
+                clip = rect if clip is None else clip.intersection(rect) or Rect(x, y, 0, 0)
+                items.append([op, rect, None, contexts[-2], color, background, None])
+                continue
+
+            if op == UNCLIP:
+                clip = clips.pop()
+                contexts.pop()
+                items.append([op, rect, None, contexts[-1], color, background, None])
+                continue
+
+            visible = rect if clip is None else rect.intersection(clip)
+
+            if visible is None:
+                continue
+
+            if op == FILL:
+                rect = visible
+
+            items.append([op, rect, visible, contexts[-1], color, background, self.refs[i]])
+
+        return items
+
+def ring_sides(rect):
+    # Sides of a rectangle outline of width 1, in the order of border_rects
+    return (
+        (rect.x, rect.y, rect.width, 1),
+        (rect.x + rect.width - 1, rect.y, 1, rect.height),
+        (rect.x, rect.y + rect.height - 1, rect.width, 1),
+        (rect.x, rect.y, 1, rect.height))
+
+def fill_pixels(items):
+    pixels = 0
+
+    for item in items:
+        if item[0] == FILL:
+            pixels += item[1].area()
+        elif item[0] == RING:
+            pixels += 2 * (item[1].width + item[1].height) - 4
+
+    return pixels
+
+def opaque(item):
+    return item[0] == FILL or (item[0] == BITMAP and
+        item[4] != Color.TRANSPARENT and
+        item[5] != Color.TRANSPARENT)
+
+def touches(item, rect):
+    # Whether an operation may draw within the rectangle
+    if item[2] is None:
+        return False
+
+    if item[0] == RING:
+        return any(rect.intersects(Rect(*side)) for side in ring_sides(item[1]))
+
+    return item[2].intersects(rect)
+
+def remove_overdraw(items):
+    kept = []
+
+    for i in range(len(items)):
+        item = items[i]
+
+        if item[0] == FILL:
+            pieces = [item[1]]
+
+            for later in items[i + 1:]:
+                if opaque(later):
+                    pieces = [part for piece in pieces for part in piece.subtract(later[2])]
+
+                    if not pieces:
+                        break
+
+            if not pieces:
+                continue
+
+            # Only the bounding rectangle of the uncovered parts is filled
+            rect = pieces[0]
+
+            for piece in pieces[1:]:
+                rect = rect.union(piece)
+
+            item[1] = item[2] = rect
+
+        kept.append(item)
+
+    return kept
+
+def remove_background(items, background):
+    kept = []
+
+    for item in items:
+        if item[0] == FILL and item[4] == background and not any(touches(earlier, item[1]) for earlier in kept):
+            continue
+
+        kept.append(item)
+
+    return kept
+
+def merge_rings(items):
+    # Four consecutive fills of the sides of a border of width 1 become a ring
+    kept = []
+    i = 0
+
+    while i < len(items):
+        sides = items[i:i + 4]
+
+        if (len(sides) == 4 and
+                all(side[0] == FILL and side[4] == sides[0][4] and side[3] == sides[0][3] for side in sides)):
+            rect = sides[0][1].union(sides[1][1]).union(sides[2][1]).union(sides[3][1])
+
+            if rect.width > 2 and rect.height > 2 and ring_sides(rect) == tuple(tuple(side[1]) for side in sides):
+                kept.append([RING, rect, rect, sides[0][3], sides[0][4], 0, None])
+                i += 4
+                continue
+
+        kept.append(items[i])
+        i += 1
+
+    return kept
+
+def merge_fills(items):
+    # Merges pairs of fills of the same color in the same clip context whose union
+    # is a rectangle, if no operation in between overlaps the one being moved
+    merged = True
+
+    while merged:
+        merged = False
+
+        for i in range(len(items)):
+            a = items[i]
+
+            if a[0] != FILL:
+                continue
+
+            for j in range(i + 1, len(items)):
+                b = items[j]
+
+                if b[0] != FILL or b[4] != a[4] or b[3] != a[3]:
+                    continue
+
+                union = a[1].union(b[1])
+                overlap = a[1].intersection(b[1])
+
+                if union.area() != a[1].area() + b[1].area() - (overlap.area() if overlap is not None else 0):
+                    continue
+
+                between = items[i + 1:j]
+
+                if not any(touches(item, b[1]) for item in between):
+                    a[1] = a[2] = union
+                    del items[j]
+                elif not any(touches(item, a[1]) for item in between):
+                    b[1] = b[2] = union
+                    del items[i]
+                else:
+                    continue
+
+                merged = True
+                break
+
+            if merged:
+                break
+
+def display_list(box):
+    # Compiles a laid out viewport or box, operations of a viewport are clipped to it
+    if isinstance(box, Viewport):
+        display = DisplayList(box.border_box())
+        display.compile(box.children)
+    else:
+        display = DisplayList()
+        display.compile([box])
+
+    return display
+
+def cached_display_list(key, box):
+    # Display list of a laid out screen compiled on first use
+    display = display_cache.get(key)
+
+    if display is None:
+        display = display_list(box)
+        display_cache.put(key, display, len(display))
+
+    return display
@@ -1,105 +1,362 @@
-from .layout import Color, TextDecorationLine, Viewport, TextBox, BitMapBox
+from . import profile
+from .cache import Cache
+from .layout import Color, Rect, Viewport, ListBox, TextBox, BitMapBox, ScaledBitMap
 
-def background(box, framebuf):
+try:
+    import framebuf as _framebuf
+except ImportError:
+    from . import framebuffer as _framebuf
+
+# Blit sources keyed by bitmap, bounded by bytes of pixel data.
+blit_cache = Cache(4096)
+
+# Rendered texts keyed by font and text, bounded by bytes of pixel data.
+# Disabled unless resized, texts are then drawn with a single blit where possible.
+text_cache = Cache(0)
+_palette = None
+
+def fill(framebuf, x, y, width, height, color, clip=None):
+    if clip is not None:
+        right = min(x + width, clip.x + clip.width)
+        bottom = min(y + height, clip.y + clip.height)
+        x = max(x, clip.x)
+        y = max(y, clip.y)
+        width = right - x
+        height = bottom - y
+
+        if width <= 0 or height <= 0:
+            return
+
+    framebuf.fill_rect(x, y, width, height, color)
+
+def background_rect(box):
+    # Padding box in the background color, None if not painted
     x = box.position.x - box.style.padding_left
     y = box.position.y - box.style.padding_top
     width = box.dimensions.width + box.style.padding_left + box.style.padding_right
     height = box.dimensions.height + box.style.padding_top + box.style.padding_bottom
 
     if width and height and box.style.background_color != Color.TRANSPARENT:
-        framebuf.fill_rect(x, y, width, height, box.style.background_color)
+        return x, y, width, height, box.style.background_color
 
-def border(box, framebuf):
-    horizontal = (box.dimensions.width +
-        box.style.border_width_left +
-        box.style.padding_left +
-        box.style.padding_right +
-        box.style.border_width_right)
+    return None
 
-    vertical = (box.dimensions.height +
-        box.style.border_width_top +
-        box.style.padding_top +
-        box.style.padding_bottom +
-        box.style.border_width_bottom)
+def border_rects(box):
+    # Painted sides of the border as x, y, width, height and color
+    rects = []
+    horizontal = box.dimensions.width + box.style.inset_horizontal
+    vertical = box.dimensions.height + box.style.inset_vertical
 
     # top
-    x = box.position.x - box.style.padding_left - box.style.border_width_left
-    y = box.position.y - box.style.padding_top - box.style.border_width_top
+    x = box.position.x - box.style.inset_left
+    y = box.position.y - box.style.inset_top
     width = horizontal
     height = box.style.border_width_top
 
     if width and height and box.style.border_color_top != Color.TRANSPARENT:
-        framebuf.fill_rect(x, y, width, height, box.style.border_color_top)
+        rects.append((x, y, width, height, box.style.border_color_top))
 
     # right
     x = box.position.x + box.dimensions.width + box.style.padding_right
-    y = box.position.y - box.style.padding_top - box.style.border_width_top
+    y = box.position.y - box.style.inset_top
     width = box.style.border_width_right
     height = vertical
 
     if width and height and box.style.border_color_right != Color.TRANSPARENT:
-        framebuf.fill_rect(x, y, width, height, box.style.border_color_right)
+        rects.append((x, y, width, height, box.style.border_color_right))
 
     # bottom
-    x = box.position.x - box.style.padding_left - box.style.border_width_left
+    x = box.position.x - box.style.inset_left
     y = box.position.y + box.dimensions.height + box.style.padding_bottom
     width = horizontal
     height = box.style.border_width_bottom
 
     if width and height and box.style.border_color_bottom != Color.TRANSPARENT:
-        framebuf.fill_rect(x, y, width, height, box.style.border_color_bottom)
+        rects.append((x, y, width, height, box.style.border_color_bottom))
 
     # left
-    x = box.position.x - box.style.padding_left - box.style.border_width_left
-    y = box.position.y - box.style.padding_top - box.style.border_width_top
+    x = box.position.x - box.style.inset_left
+    y = box.position.y - box.style.inset_top
     width = box.style.border_width_left
     height = vertical
 
     if width and height and box.style.border_color_left != Color.TRANSPARENT:
-        framebuf.fill_rect(x, y, width, height, box.style.border_color_left)
-
-def text(box, framebuf):
-    if box.style.foreground_color != Color.TRANSPARENT:
-        framebuf.text(box.text, box.position.x, box.position.y, box.style.foreground_color)
-
-    if (box.style.text_decoration_line != TextDecorationLine.NONE and
-            box.style.text_decoration_color != Color.TRANSPARENT and
-            box.style.text_decoration_thickness):
-        if box.style.text_decoration_line == TextDecorationLine.UNDERLINE:
-            y = box.position.y + box.dimensions.height + box.style.text_decoration_offset
-        elif box.style.text_decoration_line == TextDecorationLine.OVERLINE:
-            y = box.position.y - box.style.text_decoration_thickness - box.style.text_decoration_offset
-        elif box.style.text_decoration_line == TextDecorationLine.LINE_THROUGH:
-            y = (box.position.y +
-                box.style.text_decoration_offset +
-                (box.dimensions.height - box.style.text_decoration_thickness) // 2)
-
-        framebuf.fill_rect(
-            box.position.x,
-            y,
-            box.dimensions.width,
-            box.style.text_decoration_thickness,
-            box.style.text_decoration_color)
-
-def bitmap(box, framebuf):
-    for dx, dy, bit in box.bitmap:
-        pixel = box.style.foreground_color if bit else box.style.background_color
-
-        if pixel != Color.TRANSPARENT:
-            framebuf.pixel(box.position.x + dx, box.position.y + dy, pixel)
-
-def draw(box, framebuf):
-    def draw_children(parent):
-        for child in parent.children:
-            draw(child, framebuf)
+        rects.append((x, y, width, height, box.style.border_color_left))
 
-    if isinstance(box, Viewport):
-        draw_children(box)
-    elif isinstance(box, TextBox):
-        text(box, framebuf)
-    elif isinstance(box, BitMapBox):
-        bitmap(box, framebuf)
+    return rects
+
+def background(box, framebuf, clip=None):
+    rect = background_rect(box)
+
+    if rect is not None:
+        fill(framebuf, *rect, clip)
+
+def border(box, framebuf, clip=None):
+    for rect in border_rects(box):
+        fill(framebuf, *rect, clip)
+
+def text(box, framebuf, clip=None):
+    draw_string(framebuf, box.style.font, box.text, box.position.x, box.position.y, box.style.foreground_color, clip)
+    decoration = box.decoration()
+
+    if decoration is not None:
+        fill(framebuf,
+            decoration.x,
+            decoration.y,
+            decoration.width,
+            decoration.height,
+            box.style.text_decoration_color,
+            clip)
+
+def draw_string(framebuf, font, string, x, y, color, clip=None):
+    if color == Color.TRANSPARENT:
+        return
+
+    if text_cache.capacity and can_blit(framebuf, color, Color.TRANSPARENT):
+        width, height = text_area(font, string)
+
+        if clip is None or clip.contains(Rect(x, y, width, height)):
+            source = rendered_text(font, string, width, height)
+
+            if source is not None:
+                blit_colors(source, framebuf, x, y, color, Color.TRANSPARENT)
+                return
+
+    # Fonts can draw text themselves, otherwise the built-in font of the frame buffer is used
+    if hasattr(font, 'text'):
+        font.text(framebuf, string, x, y, color, clip)
+    else:
+        draw_text(framebuf, string, x, y, color, clip)
+
+def rendered_text(font, string, width, height):
+    # Monochrome frame buffer with the text, None if it can not be cached
+    key = (font, string)
+
+    try:
+        source = text_cache.get(key)
+    except TypeError:
+        # Font not hashable
+        return None
+
+    if source is None:
+        size = width * ((height + 7) // 8)
+
+        if not size or size > text_cache.capacity:
+            return None
+
+        source = _framebuf.FrameBuffer(bytearray(size), width, height, _framebuf.MONO_VLSB)
+
+        if hasattr(font, 'text'):
+            font.text(source, string, 0, 0, Color.WHITE)
+        else:
+            source.text(string, 0, 0, Color.WHITE)
+
+        text_cache.put(key, source, size)
+
+    return source
+
+def text_area(font, string):
+    # Width and height of the pixels drawn for a string
+    if hasattr(font, 'text'):
+        return font.width(string), font.height(string)
+
+    return len(string) * 8, 8
+
+def draw_text(framebuf, string, x, y, color, clip=None):
+    if color == Color.TRANSPARENT:
+        return
+
+    # Area covered by the glyphs of the built-in 8 x 8 font
+    glyphs = Rect(x, y, *text_area(None, string))
+
+    if clip is None or clip.contains(glyphs):
+        framebuf.text(string, x, y, color)
+    else:
+        visible = clip.intersection(glyphs)
+
+        if visible is not None:
+            clipped_text(framebuf, string, x, y, color, visible)
+
+def clipped_text(framebuf, string, x, y, color, visible):
+    # Renders the visible part of the text into a scratch buffer
+    # which is blitted, or drawn by rows where blitting is not supported.
+    scratch = _framebuf.FrameBuffer(
+        bytearray(visible.width * ((visible.height + 7) // 8)),
+        visible.width,
+        visible.height,
+        _framebuf.MONO_VLSB)
+    scratch.text(string, x - visible.x, y - visible.y, 1)
+
+    if can_blit(framebuf, color, Color.TRANSPARENT):
+        blit_colors(scratch, framebuf, visible.x, visible.y, color, Color.TRANSPARENT)
+        return
+
+    for row in range(visible.height):
+        start = None
+
+        for column in range(visible.width + 1):
+            if column < visible.width and scratch.pixel(column, row):
+                if start is None:
+                    start = column
+            elif start is not None:
+                framebuf.hline(visible.x + start, visible.y + row, column - start, color)
+                start = None
+
+def blit_source(bitmap):
+    source = blit_cache.get(bitmap)
+
+    if source is None:
+        packed = bitmap.pack()
+        source = _framebuf.FrameBuffer(packed.buffer, packed.width, packed.height, _framebuf.MONO_VLSB)
+        blit_cache.put(bitmap, source, packed.length)
+
+    return source
+
+def can_blit(framebuf, foreground, background):
+    # Instrumented frame buffers pass blits through to their target
+    framebuf = getattr(framebuf, 'target', framebuf)
+
+    return (isinstance(framebuf, _framebuf.FrameBuffer) and
+        -1 <= foreground <= 0xffff and
+        -1 <= background <= 0xffff)
+
+def blit_colors(source, framebuf, x, y, foreground, background):
+    # Blits a monochrome source with set pixels in the foreground color and
+    # the others in the background color, either of them may be transparent.
+    global _palette
+
+    if foreground == Color.WHITE and background in (Color.BLACK, Color.TRANSPARENT):
+        # Source pixels already match the target colors
+        key = Color.BLACK if background == Color.TRANSPARENT else -1
+        framebuf.blit(source, x, y, key)
+        return
+
+    # Map the two source pixel values to the target colors,
+    # using a color distinct from the opaque one as key for transparency.
+    key = -1
+
+    if background == Color.TRANSPARENT:
+        key = background = 1 if foreground == 0 else 0
+    elif foreground == Color.TRANSPARENT:
+        key = foreground = 1 if background == 0 else 0
+
+    if _palette is None:
+        _palette = _framebuf.FrameBuffer(bytearray(4), 2, 1, _framebuf.RGB565)
+
+    _palette.pixel(0, 0, background)
+    _palette.pixel(1, 0, foreground)
+    framebuf.blit(source, x, y, key, _palette)
+
+def spans(framebuf, bitmap, x, y, foreground, background, clip=None):
+    for dx, dy, width, height, bit in bitmap.runs():
+        pixel = foreground if bit else background
+
+        if pixel == Color.TRANSPARENT:
+            continue
+
+        if clip is not None:
+            fill(framebuf, x + dx, y + dy, width, height, pixel, clip)
+        elif height == 1:
+            framebuf.hline(x + dx, y + dy, width, pixel)
+        else:
+            framebuf.fill_rect(x + dx, y + dy, width, height, pixel)
+
+def bitmap(box, framebuf, clip=None):
+    draw_bitmap(framebuf,
+        box.bitmap,
+        box.position.x,
+        box.position.y,
+        box.style.foreground_color,
+        box.style.background_color,
+        clip)
+
+def draw_bitmap(framebuf, bitmap, x, y, foreground, background, clip=None):
+    if foreground == Color.TRANSPARENT and background == Color.TRANSPARENT:
+        return
+
+    if clip is not None and clip.contains(Rect(x, y, bitmap.width, bitmap.height)):
+        clip = None
+
+    # Scaled bitmaps too large for the caches are filled from their runs instead of upscaled
+    oversized = isinstance(bitmap, ScaledBitMap) and bitmap.oversized()
+
+    if clip is None and not oversized and can_blit(framebuf, foreground, background):
+        blit_colors(blit_source(bitmap), framebuf, x, y, foreground, background)
     else:
-        background(box, framebuf)
-        border(box, framebuf)
-        draw_children(box)
+        spans(framebuf, bitmap, x, y, foreground, background, clip)
+
+def draw(box, framebuf, clip=None):
+    profiler = profile.profiler
+
+    if profiler is None:
+        draw_box(box, framebuf, clip)
+        return
+
+    start = profiler.start()
+    draw_box(box, framebuf, clip)
+    profiler.stop('draw', start)
+
+def draw_box(box, framebuf, clip=None):
+    descend, clip = draw_node(box, framebuf, clip)
+
+    if descend:
+        for child in box.children:
+            draw_box(child, framebuf, clip)
+
+def draw_steps(box, framebuf, clip=None):
+    # Draws like draw_box with an explicit stack, yielding after each box
+    stack = [(box, clip)]
+
+    while stack:
+        box, clip = stack.pop()
+        descend, clip = draw_node(box, framebuf, clip)
+
+        if descend:
+            for i in range(len(box.children) - 1, -1, -1):
+                stack.append((box.children[i], clip))
+
+        yield
+
+def draw_node(box, framebuf, clip):
+    # Draws the box itself, returns whether its children are drawn and their clip
+    if isinstance(box, Viewport):
+        # Nothing is drawn outside of the viewport
+        bounds = box.border_box()
+        clip = bounds if clip is None else clip.intersection(bounds)
+        return clip is not None, clip
+
+    visible = clip is None or clip.intersects(box.border_box())
+
+    if isinstance(box, TextBox):
+        if visible:
+            text(box, framebuf, clip)
+
+        return False, clip
+
+    if isinstance(box, BitMapBox):
+        if visible:
+            bitmap(box, framebuf, clip)
+
+        return False, clip
+
+    if visible:
+        background(box, framebuf, clip)
+        border(box, framebuf, clip)
+
+    # Children can overflow their parent, the subtree is skipped
+    # only when its overflow is outside of the clip
+    if clip is not None and not visible:
+        overflow = box.overflow_box()
+
+        if overflow is not None and not clip.intersects(overflow):
+            return False, clip
+
+    if isinstance(box, ListBox):
+        # Rows are clipped to the list
+        bounds = box.border_box()
+        clip = bounds if clip is None else clip.intersection(bounds)
+
+        if clip is None:
+            return False, clip
+
+    return True, clip
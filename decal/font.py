@@ -0,0 +1,105 @@
+# Proportional bitmap fonts for ComputedStyle.font, drawn by blitting glyphs.
+from array import array
+
+from .draw import blit_colors, can_blit, draw_bitmap, _framebuf
+from .layout import Color, BitMap
+
+class BitMapFont:
+    # Glyphs are read from an atlas BitMap with the glyphs of the characters side
+    # by side, widths giving the width of each glyph. Glyphs are repacked one after
+    # the other, so each glyph is a BitMap and a frame buffer sharing the same buffer.
+    # Characters default to the printable ASCII characters from space on, characters
+    # without glyph are drawn as the default character.
+    def __init__(self, atlas, widths, characters=None, spacing=0, default='?'):
+        if characters is None:
+            characters = ''.join(chr(32 + i) for i in range(len(widths)))
+
+        if len(characters) != len(widths) or sum(widths) > atlas.width:
+            raise ValueError('Glyphs do not match atlas')
+
+        pages = atlas.height // 8
+        self.glyph_height = atlas.height
+        self.spacing = spacing
+        self.widths = array('B', widths)
+        self.indices = {character: i for i, character in enumerate(characters)}
+        self.default = self.indices.get(default, 0)
+        self.buffer = bytearray(pages * sum(widths))
+        self.glyphs = []
+        self.sources = [None] * len(widths)
+
+        x = 0
+        offset = 0
+
+        for width in widths:
+            for page in range(pages):
+                start = atlas.offset + page * atlas.width + x
+                self.buffer[offset + page * width:offset + (page + 1) * width] = atlas.buffer[start:start + width]
+
+            self.glyphs.append(BitMap(self.buffer, offset, pages * width, width))
+            x += width
+            offset += pages * width
+
+    def __repr__(self):
+        return f'BitMapFont({len(self.widths)} glyphs, height={self.glyph_height})'
+
+    def index(self, character):
+        return self.indices.get(character, self.default)
+
+    def width(self, text):
+        widths = self.widths
+        indices = self.indices
+        default = self.default
+        width = 0
+
+        for character in text:
+            width += widths[indices.get(character, default)]
+
+        return width + self.spacing * len(text)
+
+    def height(self, text):
+        return self.glyph_height
+
+    def measure(self, texts):
+        return [(self.width(text), self.glyph_height) for text in texts]
+
+    def source(self, i):
+        # Frame buffer of a glyph for blitting, created on first use
+        source = self.sources[i]
+
+        if source is None:
+            glyph = self.glyphs[i]
+
+            if not glyph.width:
+                return None
+
+            view = memoryview(self.buffer)[glyph.offset:glyph.offset + glyph.length]
+            source = self.sources[i] = _framebuf.FrameBuffer(view, glyph.width, self.glyph_height, _framebuf.MONO_VLSB)
+
+        return source
+
+    def text(self, framebuf, text, x, y, color, clip=None):
+        # Draw hook used instead of framebuf.text
+        if color == Color.TRANSPARENT:
+            return
+
+        blit = can_blit(framebuf, color, Color.TRANSPARENT)
+
+        for character in text:
+            i = self.indices.get(character, self.default)
+            width = self.widths[i]
+
+            if width and (clip is None or (clip.x < x + width and
+                    x < clip.x + clip.width and
+                    clip.y < y + self.glyph_height and
+                    y < clip.y + clip.height)):
+                inside = clip is None or (clip.x <= x and
+                    clip.y <= y and
+                    x + width <= clip.x + clip.width and
+                    y + self.glyph_height <= clip.y + clip.height)
+
+                if blit and inside:
+                    blit_colors(self.source(i), framebuf, x, y, color, Color.TRANSPARENT)
+                else:
+                    draw_bitmap(framebuf, self.glyphs[i], x, y, color, Color.TRANSPARENT, clip)
+
+            x += width + self.spacing
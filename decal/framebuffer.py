@@ -0,0 +1,502 @@
+# Host implementation of the MicroPython framebuf module, for running decal
+# on CPython, e.g. in tests, for screenshots or for rendering device screens
+# on a server. Supports the MONO_VLSB, MONO_HLSB and RGB565 formats and uses
+# NumPy for rectangles, blits and exports when it is installed.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MONO_VLSB = 0
+RGB565 = 1
+MONO_HLSB = 3
+
+# 8 x 8 font for characters 32 to 127. Each byte is a column of 8 pixels, LSB at top.
+FONT_8X8 = (
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x4f\x4f\x00\x00\x00\x00'  # space !
+    b'\x00\x07\x07\x00\x00\x07\x07\x00\x14\x7f\x7f\x14\x14\x7f\x7f\x14'  # " #
+    b'\x00\x24\x2e\x6b\x6b\x3a\x12\x00\x00\x63\x33\x18\x0c\x66\x63\x00'  # $ %
+    b'\x00\x32\x7f\x4d\x4d\x77\x72\x50\x00\x00\x00\x04\x06\x03\x01\x00'  # & '
+    b'\x00\x00\x1c\x3e\x63\x41\x00\x00\x00\x00\x41\x63\x3e\x1c\x00\x00'  # ( )
+    b'\x08\x2a\x3e\x1c\x1c\x3e\x2a\x08\x00\x08\x08\x3e\x3e\x08\x08\x00'  # * +
+    b'\x00\x00\x80\xe0\x60\x00\x00\x00\x00\x08\x08\x08\x08\x08\x08\x00'  # , -
+    b'\x00\x00\x00\x60\x60\x00\x00\x00\x00\x40\x60\x30\x18\x0c\x06\x02'  # . /
+    b'\x00\x3e\x7f\x49\x45\x7f\x3e\x00\x00\x40\x44\x7f\x7f\x40\x40\x00'  # 0 1
+    b'\x00\x62\x73\x51\x49\x4f\x46\x00\x00\x22\x63\x49\x49\x7f\x36\x00'  # 2 3
+    b'\x00\x18\x18\x14\x16\x7f\x7f\x10\x00\x27\x67\x45\x45\x7d\x39\x00'  # 4 5
+    b'\x00\x3e\x7f\x49\x49\x7b\x32\x00\x00\x03\x03\x79\x7d\x07\x03\x00'  # 6 7
+    b'\x00\x36\x7f\x49\x49\x7f\x36\x00\x00\x26\x6f\x49\x49\x7f\x3e\x00'  # 8 9
+    b'\x00\x00\x00\x24\x24\x00\x00\x00\x00\x00\x80\xe4\x64\x00\x00\x00'  # : ;
+    b'\x00\x08\x1c\x36\x63\x41\x41\x00\x00\x14\x14\x14\x14\x14\x14\x00'  # < =
+    b'\x00\x41\x41\x63\x36\x1c\x08\x00\x00\x02\x03\x51\x59\x0f\x06\x00'  # > ?
+    b'\x00\x3e\x7f\x41\x4d\x4f\x2e\x00\x00\x7c\x7e\x0b\x0b\x7e\x7c\x00'  # @ A
+    b'\x00\x7f\x7f\x49\x49\x7f\x36\x00\x00\x3e\x7f\x41\x41\x63\x22\x00'  # B C
+    b'\x00\x7f\x7f\x41\x63\x3e\x1c\x00\x00\x7f\x7f\x49\x49\x41\x41\x00'  # D E
+    b'\x00\x7f\x7f\x09\x09\x01\x01\x00\x00\x3e\x7f\x41\x49\x7b\x3a\x00'  # F G
+    b'\x00\x7f\x7f\x08\x08\x7f\x7f\x00\x00\x00\x41\x7f\x7f\x41\x00\x00'  # H I
+    b'\x00\x20\x60\x41\x7f\x3f\x01\x00\x00\x7f\x7f\x1c\x36\x63\x41\x00'  # J K
+    b'\x00\x7f\x7f\x40\x40\x40\x40\x00\x00\x7f\x7f\x06\x0c\x06\x7f\x7f'  # L M
+    b'\x00\x7f\x7f\x0e\x1c\x7f\x7f\x00\x00\x3e\x7f\x41\x41\x7f\x3e\x00'  # N O
+    b'\x00\x7f\x7f\x09\x09\x0f\x06\x00\x00\x1e\x3f\x21\x61\x7f\x5e\x00'  # P Q
+    b'\x00\x7f\x7f\x19\x39\x6f\x46\x00\x00\x26\x6f\x49\x49\x7b\x32\x00'  # R S
+    b'\x00\x01\x01\x7f\x7f\x01\x01\x00\x00\x3f\x7f\x40\x40\x7f\x3f\x00'  # T U
+    b'\x00\x1f\x3f\x60\x60\x3f\x1f\x00\x00\x7f\x7f\x30\x18\x30\x7f\x7f'  # V W
+    b'\x00\x63\x77\x1c\x1c\x77\x63\x00\x00\x07\x0f\x78\x78\x0f\x07\x00'  # X Y
+    b'\x00\x61\x71\x59\x4d\x47\x43\x00\x00\x00\x7f\x7f\x41\x41\x00\x00'  # Z [
+    b'\x00\x02\x06\x0c\x18\x30\x60\x40\x00\x00\x41\x41\x7f\x7f\x00\x00'  # \ ]
+    b'\x00\x08\x0c\x06\x06\x0c\x08\x00\xc0\xc0\xc0\xc0\xc0\xc0\xc0\xc0'  # ^ _
+    b'\x00\x00\x01\x03\x06\x04\x00\x00\x00\x20\x74\x54\x54\x7c\x78\x00'  # ` a
+    b'\x00\x7f\x7f\x44\x44\x7c\x38\x00\x00\x38\x7c\x44\x44\x6c\x28\x00'  # b c
+    b'\x00\x38\x7c\x44\x44\x7f\x7f\x00\x00\x38\x7c\x54\x54\x5c\x58\x00'  # d e
+    b'\x00\x08\x7e\x7f\x09\x03\x02\x00\x00\x98\xbc\xa4\xa4\xfc\x7c\x00'  # f g
+    b'\x00\x7f\x7f\x04\x04\x7c\x78\x00\x00\x00\x00\x7d\x7d\x00\x00\x00'  # h i
+    b'\x00\x40\xc0\x80\x80\xfd\x7d\x00\x00\x7f\x7f\x30\x38\x6c\x44\x00'  # j k
+    b'\x00\x00\x41\x7f\x7f\x40\x00\x00\x00\x7c\x7c\x0c\x18\x0c\x7c\x78'  # l m
+    b'\x00\x7c\x7c\x04\x04\x7c\x78\x00\x00\x38\x7c\x44\x44\x7c\x38\x00'  # n o
+    b'\x00\xfc\xfc\x24\x24\x3c\x18\x00\x00\x18\x3c\x24\x24\xfc\xfc\x00'  # p q
+    b'\x00\x7c\x7c\x04\x04\x0c\x08\x00\x00\x48\x5c\x54\x54\x74\x24\x00'  # r s
+    b'\x00\x04\x04\x3e\x7e\x44\x44\x00\x00\x3c\x7c\x40\x40\x7c\x7c\x00'  # t u
+    b'\x00\x1c\x3c\x60\x60\x3c\x1c\x00\x00\x1c\x7c\x70\x38\x70\x7c\x1c'  # v w
+    b'\x00\x44\x6c\x38\x38\x6c\x44\x00\x00\x9c\xbc\xa0\xe0\x7c\x3c\x00'  # x y
+    b'\x00\x44\x64\x74\x5c\x4c\x44\x00\x00\x08\x08\x3e\x77\x41\x41\x00'  # z {
+    b'\x00\x00\x00\xff\xff\x00\x00\x00\x00\x41\x41\x77\x3e\x08\x08\x00'  # | }
+    b'\x00\x02\x03\x01\x03\x02\x03\x01\xaa\x55\xaa\x55\xaa\x55\xaa\x55'  # ~ DEL
+)
+
+# Tables for bytes.translate setting or clearing the bits of a mask, built on demand
+_set_tables = {}
+_clear_tables = {}
+
+def set_table(mask):
+    table = _set_tables.get(mask)
+
+    if table is None:
+        table = _set_tables[mask] = bytes(b | mask for b in range(256))
+
+    return table
+
+def clear_table(mask):
+    table = _clear_tables.get(mask)
+
+    if table is None:
+        table = _clear_tables[mask] = bytes(b & ~mask for b in range(256))
+
+    return table
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        if stride is None:
+            stride = width
+
+        if format == MONO_VLSB:
+            size = stride * ((height + 7) // 8)
+        elif format == MONO_HLSB:
+            stride = (stride + 7) & ~7
+            size = stride // 8 * height
+        elif format == RGB565:
+            size = stride * height * 2
+        else:
+            raise ValueError('Unsupported format')
+
+        if len(buffer) < size:
+            raise ValueError('Buffer too small')
+
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.format = format
+        self.stride = stride
+        self.array = None
+
+        if numpy is not None:
+            if format == MONO_VLSB:
+                self.array = numpy.frombuffer(buffer, numpy.uint8, size).reshape(-1, stride)
+            elif format == MONO_HLSB:
+                self.array = numpy.frombuffer(buffer, numpy.uint8, size).reshape(height, stride // 8)
+            else:
+                self.array = numpy.frombuffer(buffer, numpy.dtype('<u2'), stride * height).reshape(height, stride)
+
+    def __repr__(self):
+        return f'FrameBuffer(bytearray({len(self.buffer)}), {self.width}, {self.height}, {self.format})'
+
+    def clip(self, x, y, width, height):
+        right = min(x + width, self.width)
+        bottom = min(y + height, self.height)
+        x = max(x, 0)
+        y = max(y, 0)
+
+        return x, y, right - x, bottom - y
+
+    def get(self, x, y):
+        if self.format == MONO_VLSB:
+            return (self.buffer[(y >> 3) * self.stride + x] >> (y & 7)) & 1
+        elif self.format == MONO_HLSB:
+            return (self.buffer[(y * self.stride + x) >> 3] >> (7 - (x & 7))) & 1
+        else:
+            i = (y * self.stride + x) * 2
+            return self.buffer[i] | (self.buffer[i + 1] << 8)
+
+    def set(self, x, y, c):
+        if self.format == MONO_VLSB:
+            i = (y >> 3) * self.stride + x
+            bit = 1 << (y & 7)
+        elif self.format == MONO_HLSB:
+            i = (y * self.stride + x) >> 3
+            bit = 0x80 >> (x & 7)
+        else:
+            i = (y * self.stride + x) * 2
+            self.buffer[i] = c & 0xff
+            self.buffer[i + 1] = (c >> 8) & 0xff
+            return
+
+        if c:
+            self.buffer[i] |= bit
+        else:
+            self.buffer[i] &= ~bit
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+
+        if c is None:
+            return self.get(x, y)
+
+        self.set(x, y, c)
+
+    def fill(self, c):
+        self.fill_rect(0, 0, self.width, self.height, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        x, y, w, h = self.clip(x, y, w, h)
+
+        if w <= 0 or h <= 0:
+            return
+
+        if self.format == MONO_VLSB:
+            self.fill_vlsb(x, y, w, h, c)
+        elif self.format == MONO_HLSB:
+            self.fill_hlsb(x, y, w, h, c)
+        else:
+            self.fill_rgb565(x, y, w, h, c)
+
+    def fill_vlsb(self, x, y, w, h, c):
+        bottom = y + h
+
+        for page in range(y >> 3, ((bottom - 1) >> 3) + 1):
+            top = max(y - page * 8, 0)
+            mask = (0xff << top) & (0xff >> max(page * 8 + 8 - bottom, 0))
+
+            if self.array is not None:
+                row = self.array[page, x:x + w]
+
+                if c:
+                    row |= mask
+                else:
+                    row &= ~mask & 0xff
+            else:
+                start = page * self.stride + x
+
+                if mask == 0xff:
+                    self.buffer[start:start + w] = (b'\xff' if c else b'\x00') * w
+                else:
+                    table = set_table(mask) if c else clear_table(mask)
+                    self.buffer[start:start + w] = bytes(self.buffer[start:start + w]).translate(table)
+
+    def fill_hlsb(self, x, y, w, h, c):
+        columns = self.stride >> 3
+        first = x >> 3
+        last = (x + w - 1) >> 3
+        first_mask = 0xff >> (x & 7)
+        last_mask = (0xff << (7 - ((x + w - 1) & 7))) & 0xff
+
+        if first == last:
+            first_mask &= last_mask
+
+        if self.array is not None:
+            rows = self.array[y:y + h]
+
+            if c:
+                rows[:, first] |= first_mask
+            else:
+                rows[:, first] &= ~first_mask & 0xff
+
+            if first != last:
+                rows[:, first + 1:last] = 0xff if c else 0
+
+                if c:
+                    rows[:, last] |= last_mask
+                else:
+                    rows[:, last] &= ~last_mask & 0xff
+
+            return
+
+        middle = (b'\xff' if c else b'\x00') * (last - first - 1)
+
+        for j in range(y, y + h):
+            i = j * columns + first
+
+            if c:
+                self.buffer[i] |= first_mask
+            else:
+                self.buffer[i] &= ~first_mask
+
+            if first != last:
+                self.buffer[i + 1:i + last - first] = middle
+                i += last - first
+
+                if c:
+                    self.buffer[i] |= last_mask
+                else:
+                    self.buffer[i] &= ~last_mask
+
+    def fill_rgb565(self, x, y, w, h, c):
+        c &= 0xffff
+
+        if self.array is not None:
+            self.array[y:y + h, x:x + w] = c
+            return
+
+        row = bytes((c & 0xff, c >> 8)) * w
+
+        for j in range(y, y + h):
+            start = (j * self.stride + x) * 2
+            self.buffer[start:start + 2 * w] = row
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+        else:
+            self.fill_rect(x, y, w, 1, c)
+            self.fill_rect(x, y + h - 1, w, 1, c)
+            self.fill_rect(x, y, 1, h, c)
+            self.fill_rect(x + w - 1, y, 1, h, c)
+
+    def text(self, s, x, y, c=1):
+        for character in s:
+            code = ord(character)
+
+            if code < 32 or code > 127:
+                code = 127
+
+            glyph = (code - 32) * 8
+
+            for j in range(8):
+                if 0 <= x + j < self.width:
+                    self.column(x + j, y, FONT_8X8[glyph + j], c)
+
+            x += 8
+
+    def column(self, x, y, bits, c):
+        # Draws set bits of a byte downwards from y, LSB at top
+        if self.format == MONO_VLSB:
+            shift = y & 7
+            page = y >> 3
+            pages = (self.height + 7) >> 3
+
+            for part in ((bits << shift) & 0xff, bits >> (8 - shift) if shift else 0):
+                if part and 0 <= page < pages:
+                    if page * 8 + 8 > self.height:
+                        part &= 0xff >> (page * 8 + 8 - self.height)
+
+                    i = page * self.stride + x
+
+                    if c:
+                        self.buffer[i] |= part
+                    else:
+                        self.buffer[i] &= ~part
+
+                page += 1
+
+            return
+
+        row = y
+
+        while bits:
+            if bits & 1 and 0 <= row < self.height:
+                self.set(x, row, c)
+
+            bits >>= 1
+            row += 1
+
+    def read(self, x, y, w, h):
+        # Pixel values of a region, rows of columns
+        if self.array is None:
+            return [[self.get(i, j) for i in range(x, x + w)] for j in range(y, y + h)]
+
+        if self.format == MONO_VLSB:
+            page = y >> 3
+            pages = self.array[page:((y + h - 1) >> 3) + 1, x:x + w]
+            bits = numpy.unpackbits(pages, axis=0, bitorder='little')
+            return bits[y - page * 8:y - page * 8 + h]
+        elif self.format == MONO_HLSB:
+            bits = numpy.unpackbits(self.array[y:y + h], axis=1, bitorder='big')
+            return bits[:, x:x + w]
+        else:
+            return self.array[y:y + h, x:x + w].copy()
+
+    def write(self, x, y, values, key=-1):
+        # Sets pixels of a region to values not equal to key
+        if self.array is None:
+            for j, row in enumerate(values):
+                for i, value in enumerate(row):
+                    if value != key:
+                        self.set(x + i, y + j, value)
+
+            return
+
+        # Monochrome sources are read as bytes, widened for colors and the key
+        values = numpy.asarray(values, numpy.int32)
+        h, w = values.shape
+        mask = values != key
+
+        if self.format == RGB565:
+            region = self.array[y:y + h, x:x + w]
+            region[mask] = values[mask] & 0xffff
+        elif self.format == MONO_VLSB:
+            page = y >> 3
+            end = ((y + h - 1) >> 3) + 1
+            bits = numpy.unpackbits(self.array[page:end, x:x + w], axis=0, bitorder='little')
+            region = bits[y - page * 8:y - page * 8 + h]
+            region[mask] = values[mask] != 0
+            self.array[page:end, x:x + w] = numpy.packbits(bits, axis=0, bitorder='little')
+        else:
+            bits = numpy.unpackbits(self.array[y:y + h], axis=1, bitorder='big')
+            region = bits[:, x:x + w]
+            region[mask] = values[mask] != 0
+            self.array[y:y + h] = numpy.packbits(bits, axis=1, bitorder='big')
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        if isinstance(fbuf, tuple):
+            fbuf = FrameBuffer(*fbuf)
+
+        cx, cy, w, h = self.clip(x, y, fbuf.width, fbuf.height)
+
+        if w <= 0 or h <= 0:
+            return
+
+        values = fbuf.read(cx - x, cy - y, w, h)
+
+        if palette is not None:
+            colors = [palette.get(i, 0) for i in range(palette.width)]
+
+            if self.array is not None and fbuf.array is not None:
+                values = numpy.array(colors)[numpy.minimum(values, len(colors) - 1)]
+            else:
+                values = [[colors[min(value, len(colors) - 1)] for value in row] for row in values]
+
+        if self.array is not None and fbuf.array is None:
+            values = numpy.array(values)
+        elif self.array is None and fbuf.array is not None:
+            values = values.tolist()
+
+        self.write(cx, cy, values, key)
+
+    def scroll(self, xstep, ystep):
+        # Shifts the content, leaving the exposed area unchanged
+        self.scroll_rect(0, 0, self.width, self.height, xstep, ystep)
+
+    def scroll_rect(self, x, y, w, h, xstep, ystep):
+        # Shifts the content within a rectangle, not part of the framebuf module
+        x, y, w, h = self.clip(x, y, w, h)
+        w -= abs(xstep)
+        h -= abs(ystep)
+
+        if w <= 0 or h <= 0:
+            return
+
+        x += max(-xstep, 0)
+        y += max(-ystep, 0)
+        self.write(x + xstep, y + ystep, self.read(x, y, w, h))
+
+    def pbm(self):
+        # Portable bitmap with lit pixels white
+        header = f'P4\n{self.width} {self.height}\n'.encode()
+
+        if self.array is not None:
+            dark = self.read(0, 0, self.width, self.height) == 0
+            return header + numpy.packbits(dark, axis=1).tobytes()
+
+        data = bytearray(((self.width + 7) >> 3) * self.height)
+        i = 0
+
+        for y in range(self.height):
+            for x in range(self.width):
+                if not self.get(x, y):
+                    data[i + (x >> 3)] |= 0x80 >> (x & 7)
+
+            i += (self.width + 7) >> 3
+
+        return header + bytes(data)
+
+    def bmp(self):
+        # Windows bitmap, 1 bit per pixel with lit pixels white for monochrome formats,
+        # otherwise 24 bits per pixel
+        if self.format == RGB565:
+            bits = 24
+            palette = b''
+            row_size = (self.width * 3 + 3) & ~3
+        else:
+            bits = 1
+            palette = b'\x00\x00\x00\x00\xff\xff\xff\x00'
+            row_size = ((self.width + 31) >> 5) * 4
+
+        offset = 14 + 40 + len(palette)
+        size = row_size * self.height
+
+        header = (b'BM' +
+            (offset + size).to_bytes(4, 'little') +
+            bytes(4) +
+            offset.to_bytes(4, 'little') +
+            (40).to_bytes(4, 'little') +
+            self.width.to_bytes(4, 'little') +
+            self.height.to_bytes(4, 'little') +
+            (1).to_bytes(2, 'little') +
+            bits.to_bytes(2, 'little') +
+            bytes(4) +
+            size.to_bytes(4, 'little') +
+            bytes(16))
+
+        if self.array is not None:
+            # Rows are stored bottom up
+            values = self.read(0, 0, self.width, self.height)[::-1]
+
+            if bits == 1:
+                rows = numpy.packbits(values != 0, axis=1)
+            else:
+                values = values.astype(numpy.uint32)
+                rows = numpy.stack((
+                    (values & 0x1f) * 255 // 31,
+                    ((values >> 5) & 0x3f) * 255 // 63,
+                    ((values >> 11) & 0x1f) * 255 // 31), axis=2).astype(numpy.uint8).reshape(self.height, -1)
+
+            data = numpy.zeros((self.height, row_size), numpy.uint8)
+            data[:, :rows.shape[1]] = rows
+            return header + palette + data.tobytes()
+
+        data = bytearray(size)
+        values = self.read(0, 0, self.width, self.height)
+
+        # Rows are stored bottom up
+        for y in range(self.height):
+            row = values[self.height - 1 - y]
+            i = y * row_size
+
+            if bits == 1:
+                for x in range(self.width):
+                    if row[x]:
+                        data[i + (x >> 3)] |= 0x80 >> (x & 7)
+            else:
+                for x in range(self.width):
+                    value = int(row[x])
+                    data[i + x * 3] = (value & 0x1f) * 255 // 31
+                    data[i + x * 3 + 1] = ((value >> 5) & 0x3f) * 255 // 63
+                    data[i + x * 3 + 2] = ((value >> 11) & 0x1f) * 255 // 31
+
+        return header + palette + bytes(data)
@@ -1,3 +1,6 @@
+from . import profile
+from .cache import Cache
+
 def expand_border(i, direction, attribute, combined):
     if direction is not None and direction[i] is not None:
         return direction[i]
@@ -12,11 +15,7 @@ def calculate_width(style, parent):
         if style.box_sizing == BoxSizing.CONTENT:
             available_width = parent.dimensions.width
         elif style.box_sizing == BoxSizing.BORDER:
-            available_width = (parent.dimensions.width -
-                style.border_width_left -
-                style.padding_left -
-                style.border_width_right -
-                style.padding_right)
+            available_width = parent.dimensions.width - style.inset_horizontal
 
         return style.width * available_width
     elif style.width is not None:
@@ -27,22 +26,79 @@ def calculate_height(style, parent):
         if style.box_sizing == BoxSizing.CONTENT:
             available_height = parent.dimensions.height
         elif style.box_sizing == BoxSizing.BORDER:
-            available_height = (parent.dimensions.height -
-                style.border_width_top -
-                style.padding_top -
-                style.border_width_bottom -
-                style.padding_bottom)
+            available_height = parent.dimensions.height - style.inset_vertical
 
         return style.height * available_height
     elif style.height is not None:
         return style.height
 
+def is_absolute(box):
+    # Whether the box or any of its descendants is positioned independently of its parent
+    return box.absolute or box.style.x is not None or box.style.y is not None
+
+# Text measurements keyed by (font, text), bounded by number of entries.
+measure_cache = Cache(256)
+
+def measure(font, text):
+    key = (font, text)
+
+    try:
+        size = measure_cache.get(key)
+    except TypeError:
+        # Fonts which are not hashable are measured every time
+        return (font.width(text), font.height(text))
+
+    if size is None:
+        size = measure_cache.put(key, (font.width(text), font.height(text)))
+
+    return size
+
+def measure_batch(boxes):
+    # Fonts implementing measure(texts), returning a (width, height) pair for each text,
+    # get all unmeasured texts of dirty boxes in a single call before layout.
+    pending = {}
+    stack = list(boxes)
+
+    while stack:
+        box = stack.pop()
+
+        if not box.dirty:
+            continue
+
+        if isinstance(box, TextBox):
+            font = box.style.font
+
+            if hasattr(font, 'measure'):
+                try:
+                    if (font, box.text) not in measure_cache:
+                        pending.setdefault(font, set()).add(box.text)
+                except TypeError:
+                    # Fonts which are not hashable are measured every time by measure
+                    pass
+        elif isinstance(box, (BlockBox, InlineBox)):
+            stack.extend(box.children)
+
+    for font, texts in pending.items():
+        texts = list(texts)
+
+        for text, size in zip(texts, font.measure(texts)):
+            measure_cache.put((font, text), size)
+
+# Materialized scaled bitmaps keyed by (bitmap, ratio), bounded by bytes of pixel data.
+bitmap_cache = Cache(4096)
+
 class ScaledBitMap:
     def __init__(self, bitmap, ratio):
+        if isinstance(bitmap, ScaledBitMap):
+            # Collapse nested scaling into a single image
+            ratio *= bitmap.ratio
+            bitmap = bitmap.bitmap
+
         self.bitmap = bitmap
         self.ratio = ratio
         self.width = bitmap.width * ratio
         self.height = bitmap.height * ratio
+        self._hash = None
 
     def __repr__(self):
         return f'ScaledBitMap({repr(self.bitmap)}, {self.ratio})'
@@ -55,26 +111,71 @@ class ScaledBitMap:
         return self.width * self.height
 
     def __iter__(self):
-        for x in range(self.width):
-            for y in range(self.height):
-                # Nearest neighbour
-                yield (x, y, self[x, y])
+        yield from self.pack()
 
     def __eq__(self, other):
         if self is other:
             return True
 
-        if not isinstance(other, ScaledBitMap):
+        if isinstance(other, ScaledBitMap) and self.bitmap == other.bitmap and self.ratio == other.ratio:
+            return True
+
+        if not isinstance(other, (BitMap, ScaledBitMap)):
+            return False
+
+        if self.width != other.width or self.height != other.height:
             return False
 
-        return self.bitmap == other.bitmap and self.ratio == other.ratio
+        # Compare pixels, e.g. against a bitmap scaled by the same ratio in advance
+        return self.pack() == other
 
     def __hash__(self):
-        return hash((self.bitmap, self.ratio))
+        # Consistent with equality on materialized pixels
+        if self._hash is None:
+            self._hash = hash(self.pack())
+
+        return self._hash
 
     def scale(self, ratio):
         return ScaledBitMap(self.bitmap, self.ratio * ratio)
 
+    def runs(self):
+        # Runs are found on the source bitmap and scaled up to rectangles.
+        for x, y, width, height, bit in self.bitmap.runs():
+            yield (x * self.ratio, y * self.ratio, width * self.ratio, height * self.ratio, bit)
+
+    def oversized(self):
+        # Whether the upscaled pixels exceed the budget of bitmap_cache
+        return (self.height + 7) // 8 * self.width > bitmap_cache.capacity
+
+    def pack(self):
+        if self.oversized():
+            # Neither cached nor kept, drawing uses runs instead
+            return self.upscale()
+
+        key = (self.bitmap, self.ratio)
+        packed = bitmap_cache.get(key)
+
+        if packed is None:
+            packed = self.upscale()
+            bitmap_cache.put(key, packed, packed.length)
+
+        return packed
+
+    def upscale(self):
+        height = self.height
+        pages = (height + 7) // 8
+        buffer = bytearray(pages * self.width)
+
+        for x in range(self.width):
+            sx = x // self.ratio
+
+            for y in range(height):
+                if self.bitmap[sx, y // self.ratio]:
+                    buffer[(y // 8) * self.width + x] |= 1 << (y % 8)
+
+        return BitMap(buffer, width=self.width)
+
 class BitMap:
     # Buffer length must be multiple of width.
     # Each byte in buffer is a column of 8 pixels. LSB at top.
@@ -105,6 +206,9 @@ class BitMap:
         if self is other:
             return True
 
+        if isinstance(other, ScaledBitMap):
+            return other == self
+
         if not isinstance(other, BitMap):
             return False
 
@@ -121,11 +225,36 @@ class BitMap:
         return hash((
             self.length,
             self.width,
-            self.buffer[self.offset:self.offset + self.length]))
+            bytes(self.buffer[self.offset:self.offset + self.length])))
 
     def scale(self, ratio):
         return ScaledBitMap(self, ratio)
 
+    def runs(self):
+        # Horizontal runs of equal bits as (x, y, width, height, bit) rectangles.
+        if not self.width:
+            return
+
+        for y in range(self.height):
+            index = self.offset + (y // 8) * self.width
+            shift = y % 8
+            start = 0
+            current = (self.buffer[index] >> shift) & 1
+
+            for x in range(1, self.width):
+                bit = (self.buffer[index + x] >> shift) & 1
+
+                if bit != current:
+                    yield (start, y, x - start, 1, current)
+                    start = x
+                    current = bit
+
+            yield (start, y, self.width - start, 1, current)
+
+    def pack(self):
+        # Buffer is already laid out as MONO_VLSB, only a writable copy is needed.
+        return BitMap(bytearray(self.buffer[self.offset:self.offset + self.length]), width=self.width)
+
 class Color:
     TRANSPARENT = -1
     BLACK = 0
@@ -183,6 +312,9 @@ class Percentage:
 
         return (other * self.value) // 100
 
+# Styles created by ComputedStyle.shorthand, bounded by number of entries.
+interned_styles = Cache(128)
+
 class ComputedStyle:
     PROPERTIES = (
         'margin_top',
@@ -262,7 +394,18 @@ class ComputedStyle:
             text_decoration_thickness=text_decoration[3])
 
         expand.update(kwargs)
-        return cls(**expand)
+        style = cls(**expand)
+
+        if style.hash_value is None:
+            return style
+
+        # Identical styles share a single object, making comparisons an identity check
+        interned = interned_styles.get(style)
+
+        if interned is None:
+            interned = interned_styles.put(style, style)
+
+        return interned
 
     def __init__(self,
             margin_top=0,
@@ -347,6 +490,40 @@ class ComputedStyle:
         self.align = align
         self.box_sizing = box_sizing
 
+        # Box model sums used during layout and drawing
+        self.inset_left = border_width_left + padding_left
+        self.inset_top = border_width_top + padding_top
+        self.inset_horizontal = self.inset_left + padding_right + border_width_right
+        self.inset_vertical = self.inset_top + padding_bottom + border_width_bottom
+        self.left_offset = margin_left + self.inset_left
+        self.top_offset = margin_top + self.inset_top
+        self.horizontal = margin_left + self.inset_horizontal + margin_right
+        self.vertical = margin_top + self.inset_vertical + margin_bottom
+
+        # Whether a box draws its own background or borders
+        self.painted = (background_color != Color.TRANSPARENT or
+            (border_width_top and border_color_top != Color.TRANSPARENT) or
+            (border_width_right and border_color_right != Color.TRANSPARENT) or
+            (border_width_bottom and border_color_bottom != Color.TRANSPARENT) or
+            (border_width_left and border_color_left != Color.TRANSPARENT))
+
+        values = tuple(getattr(self, name) for name in ComputedStyle.PROPERTIES)
+
+        try:
+            self.hash_value = hash(values)
+        except TypeError:
+            # Not hashable, e.g. a font defining only __eq__
+            self.hash_value = None
+
+        # Assigned last, the style is immutable from here on
+        self.values = values
+
+    def __setattr__(self, name, value):
+        if 'values' in self.__dict__:
+            raise AttributeError('ComputedStyle is immutable')
+
+        super().__setattr__(name, value)
+
     def __eq__(self, other):
         if self is other:
             return True
@@ -354,12 +531,22 @@ class ComputedStyle:
         if not isinstance(other, ComputedStyle):
             return False
 
-        return all(getattr(self, name) == getattr(other, name) for name in ComputedStyle.PROPERTIES)
+        if (self.hash_value is not None and
+                other.hash_value is not None and
+                self.hash_value != other.hash_value):
+            return False
+
+        return self.values == other.values
 
     def __hash__(self):
-        return hash(tuple(getattr(self, name) for name in ComputedStyle.PROPERTIES))
+        if self.hash_value is None:
+            return hash(self.values)
+
+        return self.hash_value
 
 class Position:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -380,6 +567,8 @@ class Position:
         return hash((self.x, self.y))
 
 class Dimensions:
+    __slots__ = ('width', 'height')
+
     def __init__(self, width, height):
         self.width = width
         self.height = height
@@ -399,11 +588,145 @@ class Dimensions:
     def __hash__(self):
         return hash((self.width, self.height))
 
+class Rect:
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def __repr__(self):
+        return f'Rect({self.x}, {self.y}, {self.width}, {self.height})'
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+
+        if not isinstance(other, Rect):
+            return False
+
+        return (self.x == other.x and
+            self.y == other.y and
+            self.width == other.width and
+            self.height == other.height)
+
+    def __hash__(self):
+        return hash((self.x, self.y, self.width, self.height))
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        yield self.width
+        yield self.height
+
+    def area(self):
+        return self.width * self.height
+
+    def contains(self, other):
+        return (self.x <= other.x and
+            self.y <= other.y and
+            other.x + other.width <= self.x + self.width and
+            other.y + other.height <= self.y + self.height)
+
+    def intersects(self, other):
+        return (self.x < other.x + other.width and
+            other.x < self.x + self.width and
+            self.y < other.y + other.height and
+            other.y < self.y + self.height)
+
+    def intersection(self, other):
+        x = max(self.x, other.x)
+        y = max(self.y, other.y)
+        right = min(self.x + self.width, other.x + other.width)
+        bottom = min(self.y + self.height, other.y + other.height)
+
+        if right <= x or bottom <= y:
+            return None
+
+        return Rect(x, y, right - x, bottom - y)
+
+    def union(self, other):
+        x = min(self.x, other.x)
+        y = min(self.y, other.y)
+        right = max(self.x + self.width, other.x + other.width)
+        bottom = max(self.y + self.height, other.y + other.height)
+
+        return Rect(x, y, right - x, bottom - y)
+
+    def subtract(self, other):
+        # Parts of the rectangle not covered by the other one, as up to four rectangles
+        overlap = self.intersection(other)
+
+        if overlap is None:
+            return [self]
+
+        rects = []
+        right = self.x + self.width
+        bottom = self.y + self.height
+
+        if overlap.y > self.y:
+            rects.append(Rect(self.x, self.y, self.width, overlap.y - self.y))
+
+        if overlap.y + overlap.height < bottom:
+            rects.append(Rect(self.x, overlap.y + overlap.height, self.width, bottom - overlap.y - overlap.height))
+
+        if overlap.x > self.x:
+            rects.append(Rect(self.x, overlap.y, overlap.x - self.x, overlap.height))
+
+        if overlap.x + overlap.width < right:
+            rects.append(Rect(overlap.x + overlap.width, overlap.y, right - overlap.x - overlap.width, overlap.height))
+
+        return rects
+
+# Marks boxes whose content hash can not be computed
+UNHASHABLE = object()
+
 class Box:
+    # Layout is skipped for boxes which are not dirty and were laid out with the
+    # same parent dimensions and horizontal position relative to the parent.
+    # Such boxes are only translated. Subclasses implement reflow.
+    # Slots keep boxes small, subclasses must declare their own attributes.
+    __slots__ = (
+        '_style',
+        'key',
+        'position',
+        'dimensions',
+        'parent',
+        'dirty',
+        'absolute',
+        'input_x',
+        'input_width',
+        'input_height',
+        'anchor_x',
+        'anchor_y',
+        'offset_x',
+        'offset_y',
+        'extent',
+        'cached_hash')
+
     def __init__(self, style):
-        self.style = style
+        self._style = style
+        # Identifies the box among its siblings when diffing trees
+        self.key = None
         self.position = Position(0, 0)
         self.dimensions = Dimensions(0, 0)
+        self.parent = None
+        self.dirty = True
+        self.absolute = False
+        # Horizontal position within and dimensions of the parent at the last layout
+        self.input_x = None
+        self.input_width = None
+        self.input_height = None
+        # Assigned position of the last layout and offset from it to the current position
+        self.anchor_x = 0
+        self.anchor_y = 0
+        self.offset_x = 0
+        self.offset_y = 0
+        # Border boxes of the box and its descendants relative to the position, None until laid out
+        self.extent = None
+        self.cached_hash = None
 
     def __eq__(self, other):
         if self is other:
@@ -412,12 +735,44 @@ class Box:
         if not isinstance(other, Box):
             return False
 
+        a = self.content_hash()
+        b = other.content_hash()
+
+        if a is not None and b is not None and a != b:
+            return False
+
         return (self.position == other.position and
             self.dimensions == other.dimensions and
             self.style == other.style)
 
     def __hash__(self):
-        return hash((self.position, self.dimensions, self.style))
+        return hash((self.position, self.dimensions, self.content_hash()))
+
+    def content_hash(self):
+        # Hash of style and content of the subtree, excluding geometry.
+        # Cached until invalidated, None if some style or content is not hashable.
+        if self.cached_hash is None:
+            try:
+                self.cached_hash = self.hash_content()
+            except TypeError:
+                self.cached_hash = UNHASHABLE
+
+        if self.cached_hash is UNHASHABLE:
+            return None
+
+        return self.cached_hash
+
+    def hash_content(self):
+        return hash((type(self), self.style))
+
+    @property
+    def style(self):
+        return self._style
+
+    @style.setter
+    def style(self, style):
+        self._style = style
+        self.invalidate()
 
     @property
     def x(self):
@@ -429,41 +784,169 @@ class Box:
 
     @property
     def width(self):
-        return (self.style.margin_left +
-            self.style.border_width_left +
-            self.style.padding_left +
-            self.dimensions.width +
-            self.style.padding_right +
-            self.style.border_width_right +
-            self.style.margin_right)
+        return self.style.horizontal + self.dimensions.width
 
     @property
     def height(self):
-        return (self.style.margin_top +
-            self.style.border_width_top +
-            self.style.padding_top +
-            self.dimensions.height +
-            self.style.padding_bottom +
-            self.style.border_width_bottom +
-            self.style.margin_bottom)
+        return self.style.vertical + self.dimensions.height
 
     @property
     def left_offset(self):
-        return (self.style.margin_left +
-            self.style.border_width_left +
-            self.style.padding_left)
+        return self.style.left_offset
 
     @property
     def top_offset(self):
-        return (self.style.margin_top +
-            self.style.border_width_top +
-            self.style.padding_top)
+        return self.style.top_offset
 
     def translate(self, dx, dy):
         self.position.x += dx
         self.position.y += dy
+        self.anchor_x += dx
+        self.anchor_y += dy
+
+    def invalidate(self):
+        # Must be called after changing content, e.g. a list of children, in place.
+        # Assigning style, text, bitmap or children calls it.
+        box = self
+
+        while box is not None and (not box.dirty or box.cached_hash is not None):
+            box.dirty = True
+            box.cached_hash = None
+            box = box.parent
+
+    def reuse(self, other):
+        # Take over the layout of an equal box from a previous tree
+        self.position.x = other.position.x
+        self.position.y = other.position.y
+        self.dimensions.width = other.dimensions.width
+        self.dimensions.height = other.dimensions.height
+        self.dirty = other.dirty
+        self.absolute = other.absolute
+        self.input_x = other.input_x
+        self.input_width = other.input_width
+        self.input_height = other.input_height
+        self.anchor_x = other.anchor_x
+        self.anchor_y = other.anchor_y
+        self.offset_x = other.offset_x
+        self.offset_y = other.offset_y
+        self.extent = other.extent
+        self.cached_hash = other.cached_hash
+
+    def layout(self, parent):
+        if self.settled(parent):
+            return
+
+        x = self.position.x
+        y = self.position.y
+        self.reflow(parent)
+        self.laid_out(parent, x, y)
+
+    def settled(self, parent):
+        # Translates a box laid out before instead of reflowing it if possible,
+        # returns whether it was.
+        x = self.position.x
+        y = self.position.y
+        # Alignment depends on the horizontal position within the parent
+        input_x = x - parent.position.x
+
+        if (not self.dirty and
+                input_x == self.input_x and
+                parent.dimensions.width == self.input_width and
+                parent.dimensions.height == self.input_height):
+            dx = x - self.anchor_x
+            dy = y - self.anchor_y
+
+            if not (dx or dy) or not self.absolute:
+                self.position.x = self.anchor_x + self.offset_x
+                self.position.y = self.anchor_y + self.offset_y
+
+                if dx or dy:
+                    self.translate(dx, dy)
+
+                return True
+
+        return False
+
+    def laid_out(self, parent, x, y):
+        # Records the layout of a box reflowed at x, y
+        self.dirty = False
+        self.input_x = x - parent.position.x
+        self.input_width = parent.dimensions.width
+        self.input_height = parent.dimensions.height
+        self.anchor_x = x
+        self.anchor_y = y
+        self.offset_x = self.position.x - x
+        self.offset_y = self.position.y - y
+        rect = self.overflow()
+        rect.x -= self.position.x
+        rect.y -= self.position.y
+        self.extent = rect
+
+    def reflow(self, parent):
+        pass
+
+    def overflow(self):
+        # Bounding rectangle of everything drawn for the subtree
+        return self.border_box()
+
+    def overflow_box(self):
+        # Overflow of the last layout at the current position, None before layout
+        if self.extent is None:
+            return None
+
+        return Rect(
+            self.position.x + self.extent.x,
+            self.position.y + self.extent.y,
+            self.extent.width,
+            self.extent.height)
+
+    def border_box(self):
+        return Rect(
+            self.position.x - self.style.inset_left,
+            self.position.y - self.style.inset_top,
+            self.dimensions.width + self.style.inset_horizontal,
+            self.dimensions.height + self.style.inset_vertical)
+
+def layout_steps(box, parent):
+    # Lays out box like box.layout(parent) with an explicit stack instead of
+    # recursion, yielding after each box. Frames hold the box, its parent,
+    # the state passed between its children, its position before reflowing
+    # and the index of the next child, -1 before the box is entered.
+    stack = [[box, parent, None, 0, 0, -1]]
+
+    while stack:
+        frame = stack[-1]
+        box, parent, state, x, y, i = frame
+
+        if i < 0 and not isinstance(box, (BlockBox, InlineBox)):
+            box.layout(parent)
+        elif i < 0 and not box.settled(parent):
+            frame[2] = box.begin(parent)
+            frame[3] = box.position.x
+            frame[4] = box.position.y
+            frame[5] = 0
+            continue
+        elif 0 <= i < len(box.children):
+            child = box.children[i]
+            box.place(child, state)
+            frame[5] = i + 1
+            stack.append([child, box, None, 0, 0, -1])
+            continue
+        elif i >= 0:
+            box.end(parent, state)
+            box.laid_out(parent, x, y)
+
+        stack.pop()
+
+        if stack:
+            frame = stack[-1]
+            frame[2] = frame[0].placed(box, frame[2])
+
+        yield
 
 class Viewport:
+    __slots__ = ('position', 'dimensions', 'children')
+
     def __init__(self, position, dimensions, children):
         self.position = position
         self.dimensions = dimensions
@@ -490,7 +973,27 @@ class Viewport:
     def __hash__(self):
         return hash((self.position, self.dimensions, *self.children))
 
+    def border_box(self):
+        return Rect(self.position.x, self.position.y, self.dimensions.width, self.dimensions.height)
+
     def layout(self):
+        profiler = profile.profiler
+
+        if profiler is None:
+            self.layout_children()
+            return
+
+        start = profiler.start()
+        self.layout_children()
+        profiler.stop('layout', start)
+
+    def layout_children(self):
+        for _ in self.layout_steps():
+            pass
+
+    def layout_steps(self):
+        # Lays out the children one box at a time, yielding after each
+        measure_batch(self.children)
         child_height = 0
 
         for child in self.children:
@@ -508,7 +1011,7 @@ class Viewport:
             else:
                 child.position.y = child.style.y
 
-            child.layout(self)
+            yield from layout_steps(child, self)
 
             if child.style.x is None and child.style.y is None:
                 child_height += child.height
@@ -517,6 +1020,8 @@ class Viewport:
             self.dimensions.height = child_height
 
 class BlockBox(Box):
+    __slots__ = ('_children',)
+
     def __init__(self, style, children):
         super().__init__(style)
         self.children = children
@@ -538,54 +1043,153 @@ class BlockBox(Box):
         return all(self.children[i] == other.children[i] for i in range(len(self.children)))
 
     def __hash__(self):
-        return hash((super().__hash__(), *self.children))
+        return super().__hash__()
 
-    def layout(self, parent):
+    def hash_content(self):
+        hashes = tuple(child.content_hash() for child in self.children)
+
+        if None in hashes:
+            return UNHASHABLE
+
+        return hash((type(self), self.style, *hashes))
+
+    @property
+    def children(self):
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+        for child in children:
+            child.parent = self
+
+        self.invalidate()
+
+    def reflow(self, parent):
+        state = self.begin(parent)
+
+        for child in self.children:
+            self.place(child, state)
+            child.layout(self)
+            state = self.placed(child, state)
+
+        self.end(parent, state)
+
+    def begin(self, parent):
+        # Sizes the box before laying out its children, returns the state
+        # passed on from child to child
         if self.style.width is None:
-            horizontal = (self.style.margin_left +
-                self.style.margin_right +
-                self.style.border_width_left +
-                self.style.border_width_right +
-                self.style.padding_left +
-                self.style.padding_right)
-
-            self.dimensions.width = parent.dimensions.width - horizontal
+            self.dimensions.width = parent.dimensions.width - self.style.horizontal
         else:
             self.dimensions.width = calculate_width(self.style, parent)
 
         self.dimensions.height = calculate_height(self.style, parent)
+        return self.children_top()
 
-        child_height = 0
-
-        for child in self.children:
-            if child.style.x is None:
-                child.position.x = (self.position.x +
-                    child.left_offset)
-            else:
-                child.position.x = child.style.x
+    def place(self, child, child_height):
+        if child.style.x is None:
+            child.position.x = (self.position.x +
+                child.left_offset)
+        else:
+            child.position.x = child.style.x
 
-            if child.style.y is None:
-                child.position.y = (self.position.y +
-                    child_height +
-                    child.top_offset)
-            else:
-                child.position.y = child.style.y
+        if child.style.y is None:
+            child.position.y = (self.position.y +
+                child_height +
+                child.top_offset)
+        else:
+            child.position.y = child.style.y
 
-            child.layout(self)
+    def placed(self, child, child_height):
+        if child.style.x is None and child.style.y is None:
+            child_height += child.height
 
-            if child.style.x is None and child.style.y is None:
-                child_height += child.height
+        return child_height
 
+    def end(self, parent, child_height):
         if self.style.height is None:
             self.dimensions.height = child_height
 
+        self.absolute = any(is_absolute(child) for child in self.children)
+
+    def children_top(self):
+        # Vertical offset of the first child from the content box
+        return 0
+
     def translate(self, dx, dy):
         super().translate(dx, dy)
 
         for child in self.children:
             child.translate(dx, dy)
 
+    def overflow(self):
+        rect = self.border_box()
+
+        for child in self.children:
+            extent = child.overflow_box()
+
+            if extent is not None:
+                rect = rect.union(extent)
+
+        return rect
+
+class ListBox(BlockBox):
+    # Block showing a window of a longer list of rows, scrolled by scroll pixels.
+    # Only the rows from index first on are children, stacked from the estimated
+    # position first * row_height of the first of them. Children outside of the
+    # window height are clipped when drawing.
+    __slots__ = ('first', 'count', 'row_height', 'window', 'scroll')
+
+    def __init__(self, style, children, first, count, row_height, window, scroll):
+        super().__init__(style, children)
+        self.first = first
+        self.count = count
+        self.row_height = row_height
+        self.window = window
+        self.scroll = scroll
+
+    def __repr__(self):
+        children = ', '.join(repr(child) for child in self.children)
+        placement = ', '.join(str(value) for value in self.placement())
+        return f'ListBox(ComputedStyle(), [{children}], {placement})'
+
+    def __eq__(self, other):
+        if not super().__eq__(other):
+            return False
+
+        if not isinstance(other, ListBox):
+            return False
+
+        return self.placement() == other.placement()
+
+    def __hash__(self):
+        return super().__hash__()
+
+    def placement(self):
+        return (self.first, self.count, self.row_height, self.window, self.scroll)
+
+    def hash_content(self):
+        content = super().hash_content()
+
+        if content is UNHASHABLE:
+            return UNHASHABLE
+
+        return hash((content, self.placement()))
+
+    def end(self, parent, child_height):
+        super().end(parent, child_height)
+        self.dimensions.height = self.window
+
+    def children_top(self):
+        return self.first * self.row_height - self.scroll
+
+    def overflow(self):
+        return self.border_box()
+
 class InlineBox(Box):
+    __slots__ = ('_children',)
+
     def __init__(self, style, children):
         super().__init__(style)
         self.children = children
@@ -607,27 +1211,58 @@ class InlineBox(Box):
         return all(self.children[i] == other.children[i] for i in range(len(self.children)))
 
     def __hash__(self):
-        return hash((super().__hash__(), *self.children))
+        return super().__hash__()
 
-    def layout(self, parent):
-        self.dimensions.width = calculate_width(self.style, parent)
-        self.dimensions.height = calculate_height(self.style, parent)
+    def hash_content(self):
+        hashes = tuple(child.content_hash() for child in self.children)
 
-        child_width = 0
-        child_height = 0
+        if None in hashes:
+            return UNHASHABLE
 
-        for child in self.children:
-            child.position.x = (self.position.x +
-                child_width +
-                child.left_offset)
+        return hash((type(self), self.style, *hashes))
 
-            child.position.y = (self.position.y +
-                child.top_offset)
+    @property
+    def children(self):
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+        for child in children:
+            child.parent = self
+
+        self.invalidate()
+
+    def reflow(self, parent):
+        state = self.begin(parent)
 
+        for child in self.children:
+            self.place(child, state)
             child.layout(self)
+            state = self.placed(child, state)
+
+        self.end(parent, state)
+
+    def begin(self, parent):
+        # State passed on from child to child is their width and height
+        self.dimensions.width = calculate_width(self.style, parent)
+        self.dimensions.height = calculate_height(self.style, parent)
+        return (0, 0)
+
+    def place(self, child, state):
+        child.position.x = (self.position.x +
+            state[0] +
+            child.left_offset)
+
+        child.position.y = (self.position.y +
+            child.top_offset)
 
-            child_width += child.width
-            child_height = max(child_height, child.height)
+    def placed(self, child, state):
+        return (state[0] + child.width, max(state[1], child.height))
+
+    def end(self, parent, state):
+        child_width, child_height = state
 
         if self.style.height is None:
             self.dimensions.height = child_height
@@ -635,6 +1270,8 @@ class InlineBox(Box):
         if self.style.width is None:
             self.dimensions.width = child_width
 
+        self.absolute = any(is_absolute(child) for child in self.children)
+
         underflow = parent.dimensions.width - self.width
 
         if underflow > 0 and self.style.align != Align.START:
@@ -653,7 +1290,20 @@ class InlineBox(Box):
         for child in self.children:
             child.translate(dx, dy)
 
+    def overflow(self):
+        rect = self.border_box()
+
+        for child in self.children:
+            extent = child.overflow_box()
+
+            if extent is not None:
+                rect = rect.union(extent)
+
+        return rect
+
 class TextBox(Box):
+    __slots__ = ('_text',)
+
     def __init__(self, style, text):
         super().__init__(style)
         self.text = text
@@ -671,15 +1321,27 @@ class TextBox(Box):
         return self.text == other.text
 
     def __hash__(self):
-        return hash((super().__hash__(), self.text))
+        return super().__hash__()
+
+    def hash_content(self):
+        return hash((type(self), self.style, self.text))
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self.invalidate()
 
     @property
     def width(self):
-        return self.style.font.width(self.text)
+        return measure(self.style.font, self.text)[0]
 
     @property
     def height(self):
-        return self.style.font.height(self.text)
+        return measure(self.style.font, self.text)[1]
 
     @property
     def left_offset(self):
@@ -689,11 +1351,42 @@ class TextBox(Box):
     def top_offset(self):
         return 0
 
-    def layout(self, parent):
-        self.dimensions.height = self.height
-        self.dimensions.width = self.width
+    def reflow(self, parent):
+        self.dimensions.width, self.dimensions.height = measure(self.style.font, self.text)
+
+    def decoration(self):
+        style = self.style
+
+        if (style.text_decoration_line == TextDecorationLine.NONE or
+                style.text_decoration_color == Color.TRANSPARENT or
+                not style.text_decoration_thickness):
+            return None
+
+        if style.text_decoration_line == TextDecorationLine.UNDERLINE:
+            y = self.position.y + self.dimensions.height + style.text_decoration_offset
+        elif style.text_decoration_line == TextDecorationLine.OVERLINE:
+            y = self.position.y - style.text_decoration_thickness - style.text_decoration_offset
+        elif style.text_decoration_line == TextDecorationLine.LINE_THROUGH:
+            y = (self.position.y +
+                style.text_decoration_offset +
+                (self.dimensions.height - style.text_decoration_thickness) // 2)
+
+        return Rect(self.position.x, y, self.dimensions.width, style.text_decoration_thickness)
+
+    def border_box(self):
+        # Text boxes share the style of their parent but not its insets
+        rect = Rect(self.position.x, self.position.y, self.dimensions.width, self.dimensions.height)
+        decoration = self.decoration()
+
+        # Decoration lines may be offset outside of the text
+        if decoration is not None:
+            rect = rect.union(decoration)
+
+        return rect
 
 class BitMapBox(Box):
+    __slots__ = ('_bitmap',)
+
     def __init__(self, style, bitmap):
         super().__init__(style)
         self.bitmap = bitmap
@@ -711,7 +1404,19 @@ class BitMapBox(Box):
         return self.bitmap == other.bitmap
 
     def __hash__(self):
-        return hash((super().__hash__(), self.bitmap))
+        return super().__hash__()
+
+    def hash_content(self):
+        return hash((type(self), self.style, self.bitmap))
+
+    @property
+    def bitmap(self):
+        return self._bitmap
+
+    @bitmap.setter
+    def bitmap(self, bitmap):
+        self._bitmap = bitmap
+        self.invalidate()
 
     @property
     def width(self):
@@ -729,6 +1434,10 @@ class BitMapBox(Box):
     def top_offset(self):
         return 0
 
-    def layout(self, parent):
+    def reflow(self, parent):
         self.dimensions.height = self.height
         self.dimensions.width = self.width
+
+    def border_box(self):
+        # Bitmap boxes share the style of their parent but not its insets
+        return Rect(self.position.x, self.position.y, self.dimensions.width, self.dimensions.height)
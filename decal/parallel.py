@@ -0,0 +1,98 @@
+# Host side rendering of large or many screens on all cores, e.g. for previews
+# or generating signage images on a server. Not available on MicroPython.
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from . import framebuffer as _framebuf
+from .band import OffsetFrameBuffer, buffer_size
+from .display import display_list
+from .layout import Color, Rect
+
+def render_tile(display, format, background):
+    # Replays a display list clipped to a tile into a buffer of the tile
+    tile = display.bounds
+    framebuf = _framebuf.FrameBuffer(bytearray(buffer_size(tile.width, tile.height, format)),
+        tile.width, tile.height, format)
+    framebuf.fill(background)
+    display.replay(OffsetFrameBuffer(framebuf, tile.x, tile.y))
+    return framebuf.buffer
+
+def render_viewport(viewport, format, background):
+    # Lays out and draws a whole viewport, returns the buffer
+    bounds = viewport.border_box()
+    viewport.layout()
+    framebuf = _framebuf.FrameBuffer(bytearray(buffer_size(bounds.width, bounds.height, format)),
+        bounds.width, bounds.height, format)
+    framebuf.fill(background)
+    display_list(viewport).replay(OffsetFrameBuffer(framebuf, bounds.x, bounds.y))
+    return framebuf.buffer
+
+class ParallelRenderer:
+    # Renders on a pool of worker processes, or threads if processes is False or
+    # the platform has no process pools. Replaying display lists is pure Python
+    # and holds the GIL, so threads only render in parallel where the NumPy
+    # backend releases it. Processes need picklable fonts and bitmaps.
+    def __init__(self, workers=None, processes=True, tile_width=64, tile_height=64, format=_framebuf.RGB565):
+        self.pool = None
+
+        if processes:
+            try:
+                self.pool = ProcessPoolExecutor(workers)
+            except (ImportError, NotImplementedError, OSError):
+                # No working multiprocessing, e.g. without sem_open
+                pass
+
+        self.processes = self.pool is not None
+
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(workers)
+
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.format = format
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def tiles(self, bounds):
+        for y in range(bounds.y, bounds.y + bounds.height, self.tile_height):
+            for x in range(bounds.x, bounds.x + bounds.width, self.tile_width):
+                yield Rect(x, y, self.tile_width, self.tile_height).intersection(bounds)
+
+    def render(self, viewport, framebuf=None, background=Color.BLACK):
+        # Renders the tiles of a laid out viewport in parallel, each from a copy of its
+        # display list clipped to the tile, and stitches them into framebuf, which is
+        # created with the size of the viewport if not given. Returns the frame buffer.
+        bounds = viewport.border_box()
+        display = display_list(viewport)
+        tiles = list(self.tiles(bounds))
+
+        if framebuf is None:
+            framebuf = _framebuf.FrameBuffer(bytearray(buffer_size(bounds.width, bounds.height, self.format)),
+                bounds.width, bounds.height, self.format)
+
+        clipped = [display.clipped(tile) for tile in tiles]
+        buffers = self.pool.map(render_tile, clipped, [self.format] * len(tiles), [background] * len(tiles))
+
+        for tile, buffer in zip(tiles, buffers):
+            source = _framebuf.FrameBuffer(buffer, tile.width, tile.height, self.format)
+            framebuf.blit(source, tile.x - bounds.x, tile.y - bounds.y)
+
+        return framebuf
+
+    def render_many(self, viewports, background=Color.BLACK, chunksize=1):
+        # Lays out and renders each viewport on a worker, yields their frame buffers in order
+        viewports = list(viewports)
+        count = len(viewports)
+        buffers = self.pool.map(render_viewport, viewports, [self.format] * count, [background] * count,
+            chunksize=chunksize)
+
+        for viewport, buffer in zip(viewports, buffers):
+            bounds = viewport.border_box()
+            yield _framebuf.FrameBuffer(buffer, bounds.width, bounds.height, self.format)
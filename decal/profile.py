@@ -0,0 +1,155 @@
+# Instrumentation for finding where rendering time goes on a device.
+# Profiling is disabled while profiler is None, in which case the hooks in
+# layout, diff_tree and draw cost a single check per call.
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+profiler = None
+
+def enable(new_profiler):
+    global profiler
+    profiler = new_profiler
+    return new_profiler
+
+def disable():
+    global profiler
+    profiler = None
+
+class Profiler:
+    # Accumulates microseconds per phase until frame() is called, which returns
+    # the record of the frame and passes it to the callback.
+    def __init__(self, callback=None, framebuf=None):
+        self.callback = callback
+        self.framebuf = framebuf
+        self.frames = 0
+        self.record = {}
+
+    def start(self):
+        return ticks_us()
+
+    def stop(self, phase, start):
+        self.record[phase] = self.record.get(phase, 0) + ticks_diff(ticks_us(), start)
+
+    def frame(self):
+        record = self.record
+        self.record = {}
+        self.frames += 1
+
+        if self.framebuf is not None:
+            record['framebuf'] = self.framebuf.stats()
+            self.framebuf.reset()
+
+        if self.callback is not None:
+            self.callback(record)
+
+        return record
+
+class InstrumentedFrameBuffer:
+    # Wraps a frame buffer, counting calls, microseconds and pixels touched
+    # per drawing primitive. Other attributes are passed through. The built-in
+    # framebuf module does not expose dimensions, they are given to the wrapper
+    # and taken from the target otherwise. Pixels are counted within those
+    # dimensions, blits of sources without dimensions are counted without pixels.
+    def __init__(self, target, width=None, height=None):
+        self.target = target
+        self.width = width if width is not None else getattr(target, 'width', 0)
+        self.height = height if height is not None else getattr(target, 'height', 0)
+        self.calls = {}
+        self.times = {}
+        self.pixels = {}
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def reset(self):
+        self.calls = {}
+        self.times = {}
+        self.pixels = {}
+
+    def stats(self):
+        # Calls, microseconds and pixels by primitive
+        return {name: (calls, self.times[name], self.pixels[name]) for name, calls in self.calls.items()}
+
+    def count(self, name, start, pixels):
+        self.times[name] = self.times.get(name, 0) + ticks_diff(ticks_us(), start)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.pixels[name] = self.pixels.get(name, 0) + max(pixels, 0)
+
+    def area(self):
+        return self.width * self.height
+
+    def clipped(self, x, y, width, height):
+        # Pixels of a rectangle within the frame buffer
+        width = min(x + width, self.width) - max(x, 0)
+        height = min(y + height, self.height) - max(y, 0)
+        return width * height if width > 0 and height > 0 else 0
+
+    def fill(self, c):
+        start = ticks_us()
+        self.target.fill(c)
+        self.count('fill', start, self.area())
+
+    def pixel(self, x, y, c=None):
+        start = ticks_us()
+        result = self.target.pixel(x, y) if c is None else self.target.pixel(x, y, c)
+        self.count('pixel', start, self.clipped(x, y, 1, 1))
+        return result
+
+    def hline(self, x, y, w, c):
+        start = ticks_us()
+        self.target.hline(x, y, w, c)
+        self.count('hline', start, self.clipped(x, y, w, 1))
+
+    def vline(self, x, y, h, c):
+        start = ticks_us()
+        self.target.vline(x, y, h, c)
+        self.count('vline', start, self.clipped(x, y, 1, h))
+
+    def fill_rect(self, x, y, w, h, c):
+        start = ticks_us()
+        self.target.fill_rect(x, y, w, h, c)
+        self.count('fill_rect', start, self.clipped(x, y, w, h))
+
+    def rect(self, x, y, w, h, c, *args):
+        start = ticks_us()
+        self.target.rect(x, y, w, h, c, *args)
+        if args and args[0]:
+            pixels = self.clipped(x, y, w, h)
+        else:
+            # Outline as top, bottom, left and right sides
+            pixels = (self.clipped(x, y, w, 1) + self.clipped(x, y + h - 1, w, 1) +
+                self.clipped(x, y + 1, 1, h - 2) + self.clipped(x + w - 1, y + 1, 1, h - 2))
+
+        self.count('rect', start, pixels)
+
+    def text(self, s, x, y, c=1):
+        start = ticks_us()
+        self.target.text(s, x, y, c)
+        self.count('text', start, self.clipped(x, y, len(s) * 8, 8))
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        start = ticks_us()
+
+        if palette is None:
+            self.target.blit(fbuf, x, y, key)
+        else:
+            self.target.blit(fbuf, x, y, key, palette)
+
+        if isinstance(fbuf, tuple):
+            self.count('blit', start, self.clipped(x, y, fbuf[1], fbuf[2]))
+        else:
+            self.count('blit', start, self.clipped(x, y, getattr(fbuf, 'width', 0), getattr(fbuf, 'height', 0)))
+
+    def scroll(self, xstep, ystep):
+        start = ticks_us()
+        self.target.scroll(xstep, ystep)
+        self.count('scroll', start, self.area())
@@ -0,0 +1,195 @@
+# Coalesces element trees submitted faster than the display refreshes into
+# rate limited renders. Trees may be submitted from any thread or asyncio task,
+# only the latest one is rendered.
+
+from .layout import Color
+from .profile import ticks_us, ticks_diff
+
+try:
+    from _thread import allocate_lock
+except ImportError:
+    allocate_lock = None
+
+try:
+    from threading import Event
+except ImportError:
+    Event = None
+
+try:
+    from time import sleep_us
+except ImportError:
+    from time import sleep
+
+    def sleep_us(us):
+        sleep(us / 1000000)
+
+class NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+class Scheduler:
+    # Renders the latest submitted tree with decal.render at most fps times
+    # per second. With wait set, a frame is only rendered after ready() is
+    # called, e.g. from a vsync or flush complete callback. flush(framebuf, rects)
+    # is called after each render to update the display.
+    def __init__(self, decal, framebuf, fps=None, flush=None, wait=False, background=Color.BLACK, idle=1000):
+        self.decal = decal
+        self.framebuf = framebuf
+        self.interval = 1000000 // fps if fps else 0
+        self.flush = flush
+        self.wait = wait
+        self.background = background
+        self.idle = idle
+        self.lock = allocate_lock() if allocate_lock is not None else NoLock()
+        self.pending = None
+        self.since = 0
+        self.last = None
+        self.busy = False
+        self.running = False
+        self.event = None
+        self.loop = None
+        self.signal = None
+
+        self.frames = 0
+        self.dropped = 0
+        self.latency = 0
+        self.max_latency = 0
+
+    def submit(self, element):
+        # Replaces the pending tree, which is then dropped
+        with self.lock:
+            if self.pending is None:
+                self.since = ticks_us()
+            else:
+                self.dropped += 1
+
+            self.pending = element
+
+        self.wake()
+
+    def ready(self):
+        # Vsync or flush complete. Safe to call from an interrupt on MicroPython,
+        # where serve() waits on an asyncio.ThreadSafeFlag and run() polls.
+        self.busy = False
+        self.wake()
+
+    def wake(self):
+        signal = self.signal
+
+        if signal is not None:
+            signal.set()
+
+        event = self.event
+
+        if event is not None:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(event.set)
+            else:
+                event.set()
+
+    def delay(self, now=None):
+        # Microseconds until the next frame is due, None while there is nothing to render
+        if self.pending is None or self.busy:
+            return None
+
+        if self.last is None or not self.interval:
+            return 0
+
+        if now is None:
+            now = ticks_us()
+
+        return max(0, self.interval - ticks_diff(now, self.last))
+
+    def poll(self, now=None):
+        # Renders the pending tree if due, returns the redrawn rectangles or None
+        if now is None:
+            now = ticks_us()
+
+        if self.delay(now) != 0:
+            return None
+
+        with self.lock:
+            element = self.pending
+            since = self.since
+            self.pending = None
+
+        self.last = now
+        self.busy = self.wait
+        rects = self.decal.render(element, self.framebuf, self.background)
+
+        if self.flush is not None:
+            self.flush(self.framebuf, rects)
+
+        self.frames += 1
+        self.latency = ticks_diff(ticks_us(), since)
+        self.max_latency = max(self.max_latency, self.latency)
+        return rects
+
+    def run(self):
+        # Renders submitted trees until stop() is called, e.g. in a thread. Waits for
+        # submissions and ready() where threading is available, otherwise polls for
+        # them every idle microseconds. Sleeps until the next frame is due.
+        signal = self.signal = Event() if Event is not None else None
+        self.running = True
+
+        try:
+            while self.running:
+                delay = self.delay()
+
+                if delay == 0:
+                    self.poll()
+                elif signal is not None:
+                    signal.wait(None if delay is None else delay / 1000000)
+                    signal.clear()
+                else:
+                    sleep_us(self.idle if delay is None else delay)
+        finally:
+            self.signal = None
+
+    async def serve(self):
+        # Like run() as an asyncio task
+        import asyncio
+
+        flag = getattr(asyncio, 'ThreadSafeFlag', None)
+
+        if flag is not None:
+            # MicroPython, set directly by wake() even from an interrupt
+            self.event = flag()
+        else:
+            self.event = asyncio.Event()
+            get_loop = getattr(asyncio, 'get_running_loop', None)
+            loop = get_loop() if get_loop is not None else None
+            self.loop = loop if hasattr(loop, 'call_soon_threadsafe') else None
+
+        self.running = True
+
+        try:
+            while self.running:
+                delay = self.delay()
+
+                if delay is None:
+                    await self.event.wait()
+                    self.event.clear()
+                elif delay > 0:
+                    await asyncio.sleep(delay / 1000000)
+                else:
+                    self.poll()
+                    await asyncio.sleep(0)
+        finally:
+            self.event = None
+            self.loop = None
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'latency': self.latency,
+            'max_latency': self.max_latency
+        }
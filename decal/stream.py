@@ -0,0 +1,83 @@
+# Streams redrawn regions of a frame buffer to a display without copying them.
+# Regions are aligned to the addressing of the panel and passed as memoryview
+# slices of the frame buffer memory.
+
+from .layout import Rect, Viewport
+from .ui import merge_rects
+
+try:
+    import framebuf as _framebuf
+except ImportError:
+    from . import framebuffer as _framebuf
+
+def aligned(rect, format):
+    # Monochrome vertical formats are addressed by pages of 8 rows,
+    # horizontal ones by bytes of 8 columns
+    if format == _framebuf.MONO_VLSB:
+        y = rect.y & ~7
+        return Rect(rect.x, y, rect.width, ((rect.y + rect.height + 7) & ~7) - y)
+
+    if format == _framebuf.MONO_HLSB:
+        x = rect.x & ~7
+        return Rect(x, rect.y, ((rect.x + rect.width + 7) & ~7) - x, rect.height)
+
+    return rect
+
+def views(view, stride, format, rect):
+    # Contiguous slices of the window, a single one if it spans whole rows
+    x, y, width, height = rect.x, rect.y, rect.width, rect.height
+
+    if format == _framebuf.RGB565:
+        row = stride * 2
+        start = y * row + x * 2
+        size = width * 2
+        step = 1
+    elif format == _framebuf.MONO_VLSB:
+        row = stride
+        start = (y // 8) * row + x
+        size = width
+        step = 8
+    else:
+        row = (stride + 7) // 8
+        start = y * row + x // 8
+        size = width // 8
+        step = 1
+
+    if size == row:
+        yield view[start:start + row * (height // step)], x, y, width, height
+        return
+
+    for i in range(height // step):
+        yield view[start:start + size], x, y + i * step, width, step
+        start += row
+
+def regions(buffer, width, height, format, rects, stride=None):
+    # Yields (view, x, y, width, height) for the redrawn rectangles, boxes or (new, old)
+    # pairs of updated boxes, the view holding the pixels of the window in the frame
+    # buffer format. Windows spanning whole rows are passed in one view, others by row,
+    # or by page of 8 rows for MONO_VLSB.
+    stride = stride or width
+    bounds = Rect(0, 0, width, height)
+    windows = []
+
+    for item in rects:
+        # Updates from Decal are (new, old) pairs of boxes, either may be None
+        for rect in (item if isinstance(item, tuple) else (item,)):
+            if rect is None:
+                continue
+
+            if isinstance(rect, Viewport):
+                rect = rect.border_box()
+            elif not isinstance(rect, Rect):
+                rect = rect.overflow_box() or rect.border_box()
+
+            rect = rect.intersection(bounds)
+
+            if rect is not None:
+                windows.append(aligned(rect, format))
+
+    view = memoryview(buffer)
+
+    # Aligned windows may overlap
+    for rect in merge_rects(windows):
+        yield from views(view, stride, format, rect)
@@ -1,4 +1,18 @@
-from .layout import ComputedStyle, BitMap, ScaledBitMap, Box, BlockBox, InlineBox, TextBox, BitMapBox
+from . import profile
+from .profile import ticks_us, ticks_diff
+from .draw import draw, draw_steps, background_rect, border_rects
+from .layout import (
+    ComputedStyle,
+    Color,
+    Rect,
+    BitMap,
+    ScaledBitMap,
+    Box,
+    BlockBox,
+    ListBox,
+    InlineBox,
+    TextBox,
+    BitMapBox)
 
 _DEFAULT_STYLE = ComputedStyle()
 
@@ -20,45 +34,414 @@ def normalize_child(style, child):
 def same_instance(a, b, classinfo):
     return isinstance(a, classinfo) and isinstance(b, classinfo)
 
-def diff_tree(a, b):
-    if len(a) != len(b):
+def match_children(a, b):
+    # Pairs new children a with old children b. Keyed children are matched by key,
+    # the others by their order among the children without key. Children sharing a
+    # key are matched by their order among them. Returns the pairs and the old
+    # children left unmatched.
+    keyed = {}
+    duplicates = {}
+    unkeyed = []
+
+    for child in b:
+        if child.key is None:
+            unkeyed.append(child)
+        elif child.key in keyed:
+            duplicates.setdefault(child.key, []).append(child)
+        else:
+            keyed[child.key] = child
+
+    pairs = []
+    i = 0
+
+    for child in a:
+        if child.key is None:
+            old = unkeyed[i] if i < len(unkeyed) else None
+            i += 1
+        else:
+            old = keyed.pop(child.key, None)
+
+            if old is not None and child.key in duplicates:
+                # The next old child with the key is matched next
+                rest = duplicates[child.key]
+                keyed[child.key] = rest.pop(0)
+
+                if not rest:
+                    del duplicates[child.key]
+
+        pairs.append((child, old))
+
+    removed = unkeyed[i:]
+    removed.extend(keyed.values())
+
+    for rest in duplicates.values():
+        removed.extend(rest)
+
+    return pairs, removed
+
+def reuse_layout(a, b):
+    # Let box a take over the layout of box b from the previous tree
+    # if style and content are unchanged. Returns whether a is clean.
+    pairs, clean = reuse_start(a, b)
+
+    if pairs is not None:
+        for i, (x, y) in enumerate(pairs):
+            # Reordered children make the parent dirty
+            if y is None or not reuse_layout(x, y) or i >= len(b.children) or y is not b.children[i]:
+                clean = False
+
+    return reuse_end(a, b, clean)
+
+def reuse_steps(a, b):
+    # Like reuse_layout with an explicit stack instead of recursion, yielding
+    # after each box. Frames hold the boxes, their matched children, the index
+    # of the next pair and whether the box is clean so far.
+    pairs, clean = reuse_start(a, b)
+    stack = [[a, b, pairs, 0, clean]]
+
+    while True:
+        frame = stack[-1]
+        a, b, pairs, i, clean = frame
+
+        if pairs is not None and i < len(pairs):
+            x, y = pairs[i]
+            frame[3] = i + 1
+
+            if y is None:
+                frame[4] = False
+            else:
+                pairs, clean = reuse_start(x, y)
+                stack.append([x, y, pairs, 0, clean])
+
+            continue
+
+        clean = reuse_end(a, b, clean)
+        stack.pop()
+        yield
+
+        if not stack:
+            return clean
+
+        frame = stack[-1]
+        i = frame[3] - 1
+
+        if not clean or i >= len(frame[1].children) or b is not frame[1].children[i]:
+            frame[4] = False
+
+def reuse_start(a, b):
+    # Returns the matched children of containers, None for other boxes, and
+    # whether a is clean as far as the boxes themselves are concerned
+    if type(a) is not type(b) or b.dirty or a.style != b.style:
+        return None, False
+
+    if isinstance(a, (BlockBox, InlineBox)):
+        pairs, removed = match_children(a.children, b.children)
+        clean = not removed
+
+        if isinstance(a, ListBox) and a.placement() != b.placement():
+            clean = False
+
+        return pairs, clean
+
+    if isinstance(a, TextBox):
+        return None, a.text == b.text
+
+    if isinstance(a, BitMapBox):
+        return None, a.bitmap == b.bitmap
+
+    return None, False
+
+def reuse_end(a, b, clean):
+    if clean:
+        a.reuse(b)
+
+    return clean
+
+def diff_children(a, b, nodes, updates):
+    pairs, removed = match_children(a, b)
+
+    for x, y in pairs:
+        if y is None:
+            # Inserted
+            updates.append((x, None))
+        else:
+            nodes.append((x, y))
+
+    for y in removed:
+        updates.append((None, y))
+
+def unchanged(a, b):
+    # Subtrees with equal content hashes and root geometry are laid out the same
+    if a is b:
+        return True
+
+    if a.position != b.position or a.dimensions != b.dimensions:
         return False
 
-    nodes = [(a[i], b[i], True) for i in range(len(a))]
+    content_hash = a.content_hash()
+    return content_hash is not None and content_hash == b.content_hash()
+
+def diff_tree(a, b):
+    # Returns (new, old) pairs of changed boxes, with None as old box for
+    # inserted boxes and None as new box for removed ones.
+    profiler = profile.profiler
+
+    if profiler is None:
+        return diff_boxes(a, b)
+
+    start = profiler.start()
+    updates = diff_boxes(a, b)
+    profiler.stop('diff', start)
+    return updates
+
+def diff_boxes(a, b):
+    return complete(diff_steps(a, b))
+
+def diff_steps(a, b):
+    # Diffs one pair of boxes at a time, yielding after each. Returns the updates.
+    nodes = []
     updates = []
+    diff_children(a, b, nodes, updates)
 
     while len(nodes) > 0:
-        a, b, append = nodes.pop()
+        yield
+        a, b = nodes.pop()
+
+        if unchanged(a, b):
+            continue
 
         if same_instance(a, b, BlockBox) or same_instance(a, b, InlineBox):
-            if len(a.children) == len(b.children):
-                if append and (a.dimensions != b.dimensions or a.style != b.style):
-                    append = False
-                    updates.append((a, b))
-
-                for i, x in enumerate(a.children):
-                    y = b.children[i]
-                    nodes.append((x, y, append))
+            # Containers not drawing anything themselves are left to their children
+            if a.style != b.style or (a.style.painted and
+                    (a.position != b.position or a.dimensions != b.dimensions)):
+                updates.append((a, b))
             else:
-                return False
+                diff_children(a.children, b.children, nodes, updates)
         elif same_instance(a, b, TextBox):
-            if append and (a.text != b.text or a.style != b.style):
+            if a.text != b.text or a.style != b.style or a.position != b.position:
                 updates.append((a, b))
         elif same_instance(a, b, BitMapBox):
-            if append and (a.bitmap != b.bitmap or a.style != b.style):
+            if a.bitmap != b.bitmap or a.style != b.style or a.position != b.position:
                 updates.append((a, b))
         else:
-            return False
+            updates.append((a, b))
 
     return updates
 
+def complete(steps):
+    # Runs a generator of steps to the end, returns its result
+    try:
+        while True:
+            next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+def sliced(steps, budget=None, nodes=None):
+    # Runs a generator of steps, yielding whenever budget microseconds passed
+    # or nodes steps were taken since resuming. Returns the result of the steps.
+    start = ticks_us()
+    count = 0
+
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+        count += 1
+
+        if ((nodes is not None and count >= nodes) or
+                (budget is not None and ticks_diff(ticks_us(), start) >= budget)):
+            yield
+            start = ticks_us()
+            count = 0
+
+# Number of rectangles above which merge_rects returns their bounding rectangle
+MERGE_LIMIT = 64
+
+def extra_pixels(a, b):
+    # Pixels of the bounding rectangle of a and b in neither of them
+    width = max(a.x + a.width, b.x + b.width) - min(a.x, b.x)
+    height = max(a.y + a.height, b.y + b.height) - min(a.y, b.y)
+    overlap_width = min(a.x + a.width, b.x + b.width) - max(a.x, b.x)
+    overlap_height = min(a.y + a.height, b.y + b.height) - max(a.y, b.y)
+    overlap = overlap_width * overlap_height if overlap_width > 0 and overlap_height > 0 else 0
+    return width * height - a.width * a.height - b.width * b.height + overlap
+
+def merge_rects(rects, threshold=0, limit=MERGE_LIMIT):
+    # Merges rectangles with others whose bounding rectangle covers at most threshold
+    # pixels not already in either of them. Rectangles are swept from top to bottom,
+    # and ones ending more than threshold rows above the next are not merged anymore.
+    # More than limit rectangles, or ones adding up to at least the area of their
+    # bounding rectangle, are merged into it.
+    rects = sorted(rects, key=lambda rect: (rect.y, rect.x))
+
+    if not rects:
+        return rects
+
+    bounds = rects[0]
+    total = 0
+
+    for rect in rects:
+        bounds = bounds.union(rect)
+        total += rect.area()
+
+    if len(rects) > limit or (len(rects) > 1 and total >= bounds.area()):
+        return [bounds]
+
+    done = []
+    active = []
+
+    for rect in rects:
+        i = 0
+
+        while i < len(active):
+            other = active[i]
+
+            if other.y + other.height + threshold < rect.y:
+                done.append(active.pop(i))
+            elif extra_pixels(rect, other) <= threshold:
+                # The grown rectangle is compared with all active ones again
+                rect = rect.union(active.pop(i))
+                i = 0
+            else:
+                i += 1
+
+        active.append(rect)
+
+    return done + active
+
+def visible_bounds(box, bounds):
+    # Rows of lists are clipped to the list
+    parent = box.parent
+
+    while parent is not None:
+        if isinstance(parent, ListBox):
+            bounds = bounds.intersection(parent.border_box())
+
+            if bounds is None:
+                return Rect(0, 0, 0, 0)
+
+        parent = parent.parent
+
+    return bounds
+
+def damage_rects(updates, bounds):
+    rects = []
+
+    for new, old in updates:
+        for box in (new, old):
+            if box is not None:
+                # Descendants may overflow the box
+                rect = (box.overflow_box() or box.border_box()).intersection(visible_bounds(box, bounds))
+
+                if rect is not None:
+                    rects.append(rect)
+
+    return rects
+
+def damage(updates, viewport, threshold=0):
+    return merge_rects(damage_rects(updates, viewport.border_box()), threshold)
+
+def classify(updates):
+    # Splits updates into pairs of boxes which only moved and other changes
+    moved = []
+    changed = []
+
+    for new, old in updates:
+        if new is not None and old is not None and new.position != old.position and same_content(new, old):
+            moved.append((new, old))
+        else:
+            changed.append((new, old))
+
+    return moved, changed
+
+def backdrop(box, bounds):
+    # Area of the nearest painted container or the viewport behind the box,
+    # copying pixels of moved boxes is only valid within the same one
+    parent = box.parent
+
+    while parent is not None:
+        if parent.style.painted:
+            return parent.border_box().intersection(bounds)
+
+        parent = parent.parent
+
+    return bounds
+
+def moves(updates, viewport):
+    # Plans copying the pixels of moved boxes from the previous frame. Returns
+    # (region, dx, dy) shifts to apply in order and the rectangles to repaint afterwards.
+    # Moves whose pixels overlap changes or would be overwritten are repainted instead.
+    bounds = viewport.border_box()
+    moved, changed = classify(updates)
+    rects = damage_rects(changed, bounds)
+    pending = []
+
+    for new, old in moved:
+        source = old.overflow_box() or old.border_box()
+        target = new.overflow_box() or new.border_box()
+        region = source.union(target)
+        area = backdrop(new, visible_bounds(new, bounds))
+
+        if (area is not None and
+                area == backdrop(old, visible_bounds(old, bounds)) and
+                area.contains(region)):
+            pending.append((source, target, region, new, old))
+        else:
+            rects.extend(damage_rects([(new, old)], bounds))
+
+    # Sources overlapping changes are not valid
+    rejected = True
+
+    while rejected:
+        rejected = False
+
+        for move in pending:
+            if any(move[0].intersects(rect) for rect in rects):
+                pending.remove(move)
+                rects.extend(damage_rects([move[3:]], bounds))
+                rejected = True
+                break
+
+    # Order shifts so none overwrites the source of a later one
+    ordered = []
+
+    while pending:
+        for move in pending:
+            if not any(other is not move and move[2].intersects(other[0]) for other in pending):
+                ordered.append(move)
+                break
+        else:
+            # Cyclic overlaps, one of them is repainted
+            rects.extend(damage_rects([move[3:]], bounds))
+
+        pending.remove(move)
+
+    shifts = []
+
+    for i, (source, target, region, new, old) in enumerate(ordered):
+        shifts.append((region, target.x - source.x, target.y - source.y))
+
+        # Rest of the shifted region is repainted unless a later shift fills it
+        pieces = region.subtract(target)
+
+        for later in ordered[i + 1:]:
+            pieces = [part for piece in pieces for part in piece.subtract(later[1])]
+
+        rects.extend(pieces)
+
+    return shifts, rects
+
 def element(fn):
-    def normalized(style=None, content=None):
+    def normalized(style=None, content=None, key=None):
         if content is None and not isinstance(style, ComputedStyle):
             content = style
             style = None
 
-        return fn(style or _DEFAULT_STYLE, content)
+        box = fn(style or _DEFAULT_STYLE, content)
+        box.key = key
+        return box
 
     return normalized
 
@@ -70,6 +453,40 @@ def block(style, children):
 def inline(style, children):
     return InlineBox(style, [normalize_child(style, child) for child in iterate_children(children)])
 
+def virtual_list(style, count, row_height, builder, height, scroll=0, overscan=1, key=None):
+    # Block of height pixels showing count rows of about row_height pixels
+    # scrolled by scroll pixels. Only rows within the window and overscan rows
+    # around it are built by builder(index) and keyed by their index.
+    scroll = max(min(scroll, count * row_height - height), 0)
+    first = max(scroll // row_height - overscan, 0)
+    last = min((scroll + height + row_height - 1) // row_height + overscan, count)
+    style = style or _DEFAULT_STYLE
+    children = []
+
+    for i in range(first, last):
+        child = normalize_child(style, builder(i))
+
+        if child.key is None:
+            child.key = i
+
+        children.append(child)
+
+    box = ListBox(style, children, first, count, row_height, height, scroll)
+    box.key = key
+    return box
+
+def scroll_into_view(index, scroll, row_height, height):
+    # Smallest change of the scroll offset of a virtual list making the row visible
+    top = index * row_height
+
+    if top < scroll:
+        return top
+
+    if top + row_height > scroll + height:
+        return top + row_height - height
+
+    return scroll
+
 @element
 def text(style, content):
     return TextBox(style, content)
@@ -78,20 +495,279 @@ def text(style, content):
 def bitmap(style, content):
     return BitMapBox(style, content)
 
+def same_content(a, b):
+    # Whether box a looks the same as box b, ignoring the position
+    if type(a) is not type(b) or a.dimensions != b.dimensions:
+        return False
+
+    content_hash = a.content_hash()
+
+    if content_hash is not None:
+        return content_hash == b.content_hash()
+
+    if isinstance(a, TextBox):
+        return a.text == b.text and a.style == b.style
+
+    if isinstance(a, BitMapBox):
+        return a.bitmap == b.bitmap and a.style == b.style
+
+    return False
+
+def translation(updates, viewport):
+    # Detects updates only moving content within the same region, the viewport or a list,
+    # by the same offset. Returns the part of the region to shift, from the first changed
+    # box to its end, the offset and the rectangles to redraw after shifting, or None.
+    bounds = viewport.border_box()
+    region = None
+    offset = None
+    others = []
+
+    for new, old in updates:
+        if new is None or old is None:
+            others.append((new, old))
+            continue
+
+        if new.position == old.position or not same_content(new, old):
+            return None
+
+        moved = (new.position.x - old.position.x, new.position.y - old.position.y)
+        visible = visible_bounds(new, bounds)
+
+        if region is None:
+            region = visible
+            offset = moved
+        elif region != visible or offset != moved:
+            return None
+
+    if region is None:
+        return None
+
+    dx, dy = offset
+
+    for new, old in others:
+        if visible_bounds(new if new is not None else old, bounds) != region:
+            return None
+
+    # Content before the first changed box stays in place
+    changed = [box.border_box() for pair in updates for box in pair if box is not None]
+    left = max(region.x, min(rect.x for rect in changed)) if dx else region.x
+    top = max(region.y, min(rect.y for rect in changed)) if dy else region.y
+    part = Rect(left, top, region.x + region.width - left, region.y + region.height - top)
+
+    if abs(dx) >= part.width or abs(dy) >= part.height:
+        return None
+
+    if not moved_together(viewport.children, updates, part, bounds):
+        return None
+
+    # Areas not covered by the shifted content
+    rects = []
+
+    if dx:
+        rects.append(Rect(part.x if dx > 0 else part.x + part.width + dx, part.y, abs(dx), part.height))
+
+    if dy:
+        rects.append(Rect(part.x, part.y if dy > 0 else part.y + part.height + dy, part.width, abs(dy)))
+
+    for new, old in others:
+        rect = (new if new is not None else old).border_box()
+
+        if new is None:
+            # Pixels of removed boxes are shifted along
+            rect.x += dx
+            rect.y += dy
+
+        rect = rect.intersection(part)
+
+        if rect is not None:
+            rects.append(rect)
+
+    return part, dx, dy, rects
+
+def moved_together(children, updates, part, bounds):
+    # Whether all pixels drawn within part belong to updated boxes, so shifting
+    # part does not move content which stayed in place. Backgrounds covering
+    # the whole part look the same when shifted.
+    updated = set(id(new) for new, old in updates if new is not None)
+    nodes = list(children)
+
+    while nodes:
+        box = nodes.pop()
+
+        if id(box) in updated:
+            continue
+
+        overflow = box.overflow_box()
+
+        if overflow is None or not overflow.intersects(part):
+            continue
+
+        visible = part.intersection(visible_bounds(box, bounds))
+
+        if visible is None:
+            continue
+
+        if isinstance(box, (TextBox, BitMapBox)):
+            if box.border_box().intersects(visible):
+                return False
+
+            continue
+
+        rect = background_rect(box)
+
+        if rect is not None and not Rect(*rect[:4]).contains(visible) and Rect(*rect[:4]).intersects(visible):
+            return False
+
+        for rect in border_rects(box):
+            if Rect(*rect[:4]).intersects(visible):
+                return False
+
+        nodes.extend(box.children)
+
+    return True
+
+def shift(framebuf, region, dx, dy, viewport):
+    # Shifts the pixels of a region, returns whether the frame buffer supports it
+    if hasattr(framebuf, 'scroll_rect'):
+        framebuf.scroll_rect(region.x, region.y, region.width, region.height, dx, dy)
+        return True
+
+    if region == viewport.border_box():
+        # The viewport is assumed to cover the whole frame buffer
+        framebuf.scroll(dx, dy)
+        return True
+
+    return False
+
 class Decal:
-    def __init__(self, viewport):
+    # With damage enabled updates are yielded as merged Rect regions
+    # of the viewport to be cleared and redrawn with draw(viewport, framebuf, clip=rect).
+    def __init__(self, viewport, damage=False, threshold=0):
         self.viewport = viewport
+        self.damage = damage
+        self.threshold = threshold
 
     def __call__(self, new_children, diff=True):
+        updates = self.update(new_children, diff)
+
+        if self.damage:
+            yield from damage(updates, self.viewport, self.threshold)
+        else:
+            yield from updates
+
+    def update(self, new_children, diff=True):
+        # Lays out the new children, returns the changed (new, old) pairs
         if isinstance(new_children, Box):
             new_children = [new_children]
 
         old_children = self.viewport.children
+        pairs, _ = match_children(new_children, old_children)
+
+        for a, b in pairs:
+            if b is not None:
+                reuse_layout(a, b)
+
         self.viewport.children = new_children
         self.viewport.layout()
         updates = diff_tree(new_children, old_children) if diff else False
 
         if updates is False:
-            yield (self.viewport, None)
-        else:
-            yield from updates
+            updates = [(self.viewport, None)]
+
+        return updates
+
+    def update_steps(self, new_children, diff=True):
+        # Like update, yielding after each box reused, laid out or diffed
+        new_children, old_children = yield from self.adopt(new_children)
+        yield from self.viewport.layout_steps()
+        updates = (yield from diff_steps(new_children, old_children)) if diff else False
+
+        if updates is False:
+            updates = [(self.viewport, None)]
+
+        return updates
+
+    def adopt(self, new_children):
+        # Lets the new children take over the layout of unchanged old ones like update,
+        # yielding after each box. Returns the new and old children.
+        if isinstance(new_children, Box):
+            new_children = [new_children]
+
+        old_children = self.viewport.children
+        pairs, _ = match_children(new_children, old_children)
+
+        for a, b in pairs:
+            if b is not None:
+                yield from reuse_steps(a, b)
+
+        self.viewport.children = new_children
+        return new_children, old_children
+
+    def prepare(self, updates, framebuf):
+        # Shifts scrolled and moved content in the frame buffer where supported,
+        # returns the rectangles to redraw.
+        scrolled = translation(updates, self.viewport)
+
+        if scrolled is not None and shift(framebuf, *scrolled[:3], self.viewport):
+            return merge_rects(scrolled[3], self.threshold)
+
+        if hasattr(framebuf, 'scroll_rect'):
+            # Moved boxes are copied
+            shifts, rects = moves(updates, self.viewport)
+
+            for region, dx, dy in shifts:
+                framebuf.scroll_rect(region.x, region.y, region.width, region.height, dx, dy)
+
+            return merge_rects(rects, self.threshold)
+
+        return damage(updates, self.viewport, self.threshold)
+
+    def render(self, new_children, framebuf, background=Color.BLACK, diff=True):
+        # Updates and redraws the frame buffer, returns the redrawn rectangles.
+        # Content scrolled within the viewport or a list is shifted in the frame buffer
+        # where supported and only the exposed areas are redrawn. Otherwise boxes which
+        # only moved are copied where the frame buffer supports scroll_rect.
+        updates = self.update(new_children, diff)
+        rects = self.prepare(updates, framebuf)
+
+        for rect in rects:
+            framebuf.fill_rect(rect.x, rect.y, rect.width, rect.height, background)
+            draw(self.viewport, framebuf, clip=rect)
+
+        return rects
+
+    def render_steps(self, new_children, framebuf, background=Color.BLACK, diff=True):
+        # Like render, yielding after each unit of work. The frame buffer is only
+        # consistent once the steps are complete.
+        updates = yield from self.update_steps(new_children, diff)
+        rects = self.prepare(updates, framebuf)
+        bounds = self.viewport.border_box()
+
+        for rect in rects:
+            framebuf.fill_rect(rect.x, rect.y, rect.width, rect.height, background)
+            clip = rect.intersection(bounds)
+
+            if clip is not None:
+                yield from draw_steps(self.viewport, framebuf, clip)
+
+        return rects
+
+    def resumable(self, new_children, framebuf, background=Color.BLACK, diff=True, budget=None, nodes=None):
+        # Like render as a generator yielding whenever budget microseconds passed
+        # or nodes units of work were done, returns the redrawn rectangles
+        return sliced(self.render_steps(new_children, framebuf, background, diff), budget, nodes)
+
+    async def render_async(self, new_children, framebuf, background=Color.BLACK, diff=True, budget=None,
+            nodes=None):
+        # Like resumable, giving other asyncio tasks a turn whenever the budget runs out
+        import asyncio
+
+        steps = self.resumable(new_children, framebuf, background, diff, budget, nodes)
+
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+            await asyncio.sleep(0)
@@ -0,0 +1,26 @@
+from decal import ComputedStyle, Color, BitMap, block, inline, bitmap
+
+class Font8:
+    # Fixed 8 x 8 pixel font measuring lines of text
+    def __eq__(self, other):
+        return isinstance(other, Font8)
+
+    def __hash__(self):
+        return 8
+
+    def width(self, text):
+        return max(len(line) for line in text.split('\n')) * 8
+
+    def height(self, text):
+        return len(text.split('\n')) * 8
+
+def screen(values):
+    # Rows of values with an icon on a white background
+    style = ComputedStyle.shorthand(font=Font8(), padding=3, foreground_color=Color.BLACK,
+        background_color=Color.WHITE)
+    icon = BitMap(bytes([0x0f, 0xf0, 0x0f, 0xf0]))
+
+    return block([
+        inline(style, [f'value {value}', bitmap(ComputedStyle(foreground_color=Color.BLACK), icon)])
+        for value in values
+    ])
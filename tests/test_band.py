@@ -0,0 +1,53 @@
+from decal import (
+    BandRenderer,
+    Decal,
+    Viewport,
+    Position,
+    Dimensions,
+    Rect,
+    draw)
+from decal.framebuffer import FrameBuffer, MONO_VLSB, RGB565
+from helpers import screen
+
+def test_bands():
+    for format, size in ((RGB565, 2 * 64 * 48), (MONO_VLSB, 64 * 48 // 8)):
+        viewport = Viewport(Position(0, 0), Dimensions(64, 48), [screen([1, 22, 333])])
+        viewport.layout()
+        expected = FrameBuffer(bytearray(size), 64, 48, format)
+        draw(viewport, expected)
+
+        display = FrameBuffer(bytearray(size), 64, 48, format)
+
+        def sink(buffer, x, y, width, height):
+            display.blit(FrameBuffer(bytearray(buffer), width, height, format), x, y)
+
+        bands = BandRenderer(sink, 64, 8, format, tile_width=24)
+
+        assert len(bands.buffer) <= size // 12
+        assert len(bands.render(viewport)) == 18
+        assert display.buffer == expected.buffer
+
+def test_band_damage():
+    windows = []
+    display = FrameBuffer(bytearray(64 * 48 * 2), 64, 48, RGB565)
+
+    def sink(buffer, x, y, width, height):
+        windows.append(Rect(x, y, width, height))
+        display.blit(FrameBuffer(bytearray(buffer), width, height, RGB565), x, y)
+
+    viewport = Viewport(Position(0, 0), Dimensions(64, 48), [])
+    render = Decal(viewport, damage=True)
+    bands = BandRenderer(sink, 64, 8)
+    bands.render(viewport, list(render(screen([1, 22, 333]))))
+    windows.clear()
+
+    # Only the bands touched by the changed row are drawn
+    rects = list(render(screen([1, 44, 333])))
+    bands.render(viewport, rects)
+
+    assert windows == [Rect(3, 17, 61, 7), Rect(3, 24, 61, 1)]
+
+    expected = FrameBuffer(bytearray(64 * 48 * 2), 64, 48, RGB565)
+    draw(viewport, expected)
+
+    assert display.buffer == expected.buffer
@@ -0,0 +1,27 @@
+from decal import Cache
+
+def test_cache_evicts_least_recently_used():
+    cache = Cache(4)
+    cache.put('a', 1, 2)
+    cache.put('b', 2, 2)
+
+    assert cache.get('a') == 1
+
+    cache.put('c', 3, 2)
+
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.size == 4
+    assert (cache.hits, cache.misses) == (3, 0)
+
+    cache.get('b')
+
+    assert cache.hit_rate() == 0.75
+
+def test_cache_skips_oversized():
+    cache = Cache(4)
+
+    assert cache.put('a', 1, 5) == 1
+    assert cache.get('a') is None
+    assert cache.misses == 1
@@ -1,14 +1,21 @@
-from decal import Decal, ComputedStyle, Viewport, Position, Dimensions, BlockBox, TextBox, block, inline
-
-class Font8:
-    def __eq__(self, other):
-        return isinstance(other, Font8)
-
-    def width(self, text):
-        return len(text) * 8
-
-    def height(self, text):
-        return 8
+from decal import (
+    Decal,
+    ComputedStyle,
+    Color,
+    Viewport,
+    Position,
+    Dimensions,
+    Rect,
+    BlockBox,
+    TextBox,
+    block,
+    inline,
+    InstrumentedFrameBuffer,
+    virtual_list,
+    scroll_into_view)
+from decal.framebuffer import FrameBuffer, MONO_VLSB
+from decal.ui import merge_rects
+from helpers import Font8
 
 def layout(box, position, dimensions):
     box.position = position
@@ -30,7 +37,7 @@ def test_add_box_render():
     updates = list(render(block()))
 
     assert len(updates) == 1
-    assert updates[0] == (Viewport(Position(0, 0), Dimensions(0, 0), [BlockBox(ComputedStyle(), [])]), None)
+    assert updates[0] == (BlockBox(ComputedStyle(), []), None)
 
 def test_change_text_render():
     viewport = Viewport(Position(0, 0), Dimensions(0, 64), [
@@ -52,3 +59,338 @@ def test_change_text_render():
     assert updates[0] == (
         layout(TextBox(ComputedStyle(font=Font8()), 'world'), Position(0, 0), Dimensions(40, 8)),
         layout(TextBox(ComputedStyle(font=Font8()), 'hello'), Position(0, 0), Dimensions(40, 8)))
+
+def test_damage_render():
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [
+        block([
+            inline(ComputedStyle(font=Font8()), ['hello']),
+            inline(ComputedStyle(font=Font8()), ['world'])
+        ])
+    ])
+
+    viewport.layout()
+    render = Decal(viewport, damage=True)
+
+    updates = list(render(
+        block([
+            inline(ComputedStyle(font=Font8()), ['hello!']),
+            inline(ComputedStyle(font=Font8()), ['world!'])
+        ])
+    ))
+
+    assert updates == [Rect(0, 0, 48, 16)]
+
+def test_text_damage():
+    def screen(text):
+        return block([inline(ComputedStyle.shorthand(font=Font8(), padding=4), [text])])
+
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [screen('hello')])
+    viewport.layout()
+    render = Decal(viewport, damage=True)
+
+    # Only the text is damaged, not the padding of its parent
+    assert list(render(screen('world'))) == [Rect(4, 4, 40, 8)]
+
+def test_overflow_damage():
+    def screen(color):
+        style = ComputedStyle.shorthand(font=Font8(), width=16, foreground_color=color)
+        return block([block(style, [inline(style, ['overflow'])])])
+
+    def pixels(element):
+        framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+        Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(element, framebuf)
+        return framebuf.buffer
+
+    framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+    render.render(screen(Color.WHITE), framebuf)
+
+    # Text overflowing the fixed width parent is redrawn
+    assert render.render(screen(Color.BLACK), framebuf) == [Rect(0, 0, 64, 8)]
+    assert framebuf.buffer == pixels(screen(Color.BLACK))
+
+def test_merge_rects():
+    rects = [Rect(0, 0, 10, 8), Rect(10, 0, 10, 8), Rect(0, 20, 4, 4)]
+
+    assert merge_rects(rects) == [Rect(0, 0, 20, 8), Rect(0, 20, 4, 4)]
+    assert merge_rects(rects, threshold=1000) == [Rect(0, 0, 20, 24)]
+
+    # Rows of a column are merged in one sweep, distant ones are kept apart
+    rows = [Rect(0, y, 10, 2) for y in range(0, 40, 2)] + [Rect(0, 60, 10, 2)]
+    assert merge_rects(reversed(rows)) == [Rect(0, 0, 10, 40), Rect(0, 60, 10, 2)]
+
+    # Beyond the limit or when covering their bounding rectangle, rectangles are merged into it
+    scattered = [Rect(x * 8, x * 8, 4, 4) for x in range(4)]
+    assert merge_rects(scattered, limit=4) == scattered
+    assert merge_rects(scattered, limit=3) == [Rect(0, 0, 28, 28)]
+    assert merge_rects([Rect(0, 0, 10, 10), Rect(0, 5, 10, 10), Rect(5, 0, 10, 15)]) == [Rect(0, 0, 15, 15)]
+
+def test_keyed_render():
+    def rows(keys):
+        return block([inline(ComputedStyle(font=Font8()), [key], key=key) for key in keys])
+
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [rows(['a', 'b', 'c'])])
+    viewport.layout()
+    render = Decal(viewport)
+
+    updates = list(render(rows(['a', 'x', 'c'])))
+    inserted = [new.children[0].text for new, old in updates if old is None]
+    removed = [old.children[0].text for new, old in updates if new is None]
+
+    assert inserted == ['x']
+    assert removed == ['b']
+    assert len(updates) == 2
+
+    updates = list(render(rows(['x', 'a', 'c'])))
+    moved = sorted(new.text for new, old in updates)
+
+    assert moved == ['a', 'x']
+
+def test_insert_unkeyed_before_keyed():
+    def rows(keys, header=False):
+        header = [inline(ComputedStyle(font=Font8()), ['header'])] if header else []
+        return block(header + [inline(ComputedStyle(font=Font8()), [key], key=key) for key in keys])
+
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [rows(['a', 'b'])])
+    viewport.layout()
+    render = Decal(viewport)
+
+    updates = list(render(rows(['a', 'b'], header=True)))
+    inserted = [new.children[0].text for new, old in updates if old is None]
+
+    assert inserted == ['header']
+    assert viewport.children[0].children[2].position.y == 16
+
+def test_duplicate_keys():
+    def rows(keys):
+        return block([inline(ComputedStyle(font=Font8()), [text], key=key) for key, text in keys])
+
+    def pixels(element):
+        framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+        Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(element, framebuf)
+        return framebuf.buffer
+
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [rows([('a', 'one'), ('a', 'two'), ('b', 'three')])])
+    viewport.layout()
+    render = Decal(viewport)
+
+    # Children sharing a key are matched in order, the unmatched one is removed
+    updates = list(render(rows([('a', 'one'), ('b', 'three')])))
+    removed = [old.children[0].text for new, old in updates if new is None]
+
+    assert removed == ['two']
+
+    framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [])
+    render = Decal(viewport)
+    render.render(rows([('a', 'one'), ('a', 'two'), ('b', 'three')]), framebuf)
+    render.render(rows([('a', 'one'), ('b', 'three')]), framebuf)
+
+    assert framebuf.buffer == pixels(rows([('a', 'one'), ('b', 'three')]))
+
+def test_virtual_list_render():
+    built = []
+
+    def row(i):
+        built.append(i)
+        return inline(ComputedStyle.shorthand(font=Font8(), padding=2), [f'{i}'])
+
+    def rows(scroll):
+        return block([
+            inline(ComputedStyle(font=Font8()), ['title']),
+            virtual_list(None, 2000, 12, row, 48, scroll)
+        ])
+
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [])
+    render = Decal(viewport, damage=True)
+    list(render(rows(0)))
+    items = viewport.children[0].children[1]
+
+    assert built == [0, 1, 2, 3, 4]
+    assert items.dimensions.height == 48
+    assert viewport.children[0].dimensions.height == 56
+
+    built.clear()
+    updates = list(render(rows(120)))
+    items = viewport.children[0].children[1]
+
+    assert built == list(range(9, 15))
+    assert [child.key for child in items.children] == built
+    assert items.children[1].position.y == 8 + 2
+    assert updates
+    assert all(Rect(0, 8, 128, 48).contains(rect) for rect in updates)
+
+    # Clamped to the end of the list
+    list(render(rows(10 ** 6)))
+    items = viewport.children[0].children[1]
+
+    assert items.scroll == 2000 * 12 - 48
+    assert items.children[-1].key == 1999
+    assert items.children[-1].position.y + items.children[-1].height == 8 + 48 + 2
+
+def test_scroll_into_view():
+    assert scroll_into_view(0, 24, 12, 48) == 0
+    assert scroll_into_view(5, 0, 12, 48) == 24
+    assert scroll_into_view(3, 0, 12, 48) == 0
+
+def test_scroll_render():
+    style = ComputedStyle.shorthand(font=Font8(), padding=2)
+
+    def rows(scroll, title='title'):
+        return block([
+            inline(style, [title]),
+            virtual_list(None, 100, 12, lambda i: inline(style, [f'row {i}']), 48, scroll)
+        ])
+
+    def screen(element):
+        framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+        Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(element, framebuf)
+        return framebuf.buffer
+
+    framebuf = InstrumentedFrameBuffer(FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB))
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+
+    assert render.render(rows(0), framebuf) == [Rect(0, 0, 128, 60)]
+
+    # Only the exposed rows of the list are redrawn
+    for scroll, exposed in ((12, Rect(0, 48, 128, 12)), (15, Rect(0, 57, 128, 3)), (3, Rect(0, 12, 128, 12))):
+        framebuf.reset()
+
+        assert render.render(rows(scroll), framebuf) == [exposed]
+        assert framebuf.pixels['fill_rect'] == exposed.area()
+        assert framebuf.target.buffer == screen(rows(scroll))
+
+    # Changed content is redrawn
+    assert render.render(rows(0, 'other'), framebuf) != []
+    assert framebuf.target.buffer == screen(rows(0, 'other'))
+
+def test_insert_remove_render():
+    style = ComputedStyle.shorthand(font=Font8(), padding=2)
+
+    def rows(keys):
+        return block([inline(style, [f'row {key}'], key=key) for key in keys])
+
+    def screen(element):
+        framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+        Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(element, framebuf)
+        return framebuf.buffer
+
+    framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+    render.render(rows([1, 2, 3]), framebuf)
+
+    # Rows before the inserted or removed one stay in place
+    for keys, top in (([1, 2, 4, 3], 24), ([1, 2, 3], 24), ([1, 3], 12), ([5, 1, 3], 0), ([5, 3], 12),
+            ([5, 3, 6, 7], 24), ([5, 3, 7], 24)):
+        rects = render.render(rows(keys), framebuf)
+
+        assert framebuf.buffer == screen(rows(keys))
+        assert min(rect.y for rect in rects) >= top
+
+def test_move_render():
+    style = ComputedStyle.shorthand(font=Font8(), padding=2)
+
+    def rows(keys):
+        return block([inline(style, [f'row {key}'], key=key) for key in keys])
+
+    def screen(element):
+        framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+        Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(element, framebuf)
+        return framebuf.buffer
+
+    framebuf = InstrumentedFrameBuffer(FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB))
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+    render.render(rows([1, 2, 3]), framebuf)
+
+    # Rows moved down by the inserted one are copied, only the new row is drawn
+    framebuf.reset()
+    rects = render.render(rows([0, 1, 2, 3]), framebuf)
+
+    assert framebuf.target.buffer == screen(rows([0, 1, 2, 3]))
+    assert framebuf.pixels['fill_rect'] < 128 * 48
+    assert rects == [Rect(0, 0, 128, 12)]
+
+    # Removing it moves them back
+    rects = render.render(rows([1, 3]), framebuf)
+
+    assert framebuf.target.buffer == screen(rows([1, 3]))
+    assert sum(rect.area() for rect in rects) <= 128 * 36
+
+def test_resumable_render():
+    style = ComputedStyle.shorthand(font=Font8(), padding=2)
+
+    def rows(keys):
+        return block([inline(style, [f'row {key}'], key=key) for key in keys])
+
+    def screen(element):
+        framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+        Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(element, framebuf)
+        return framebuf.buffer
+
+    framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+    render.render(rows([1, 2, 3]), framebuf)
+
+    # Yields after every unit of work until the frame is complete
+    steps = render.resumable(rows([0, 1, 2]), framebuf, nodes=1)
+    count = 0
+
+    try:
+        while True:
+            next(steps)
+            count += 1
+    except StopIteration as stop:
+        rects = stop.value
+
+    assert count > 4
+    assert rects
+    assert framebuf.buffer == screen(rows([0, 1, 2]))
+
+    # Without a budget it runs to the end
+    assert list(render.resumable(rows([2, 4]), framebuf)) == []
+    assert framebuf.buffer == screen(rows([2, 4]))
+
+def test_resumable_single_root():
+    style = ComputedStyle(font=Font8())
+
+    def rows(changed):
+        return block([inline(style, ['changed' if i == changed else f'row {i}']) for i in range(40)])
+
+    def resumptions(element, framebuf):
+        return len(list(render.resumable(element, framebuf, nodes=5)))
+
+    framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    expected = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+
+    # All 81 boxes are laid out one at a time
+    assert resumptions(rows(None), framebuf) > 81 // 5
+
+    # Reusing the layout and diffing are split as well
+    assert resumptions(rows(3), framebuf) > 81 // 5
+
+    Decal(Viewport(Position(0, 0), Dimensions(128, 64), [])).render(rows(3), expected)
+
+    assert framebuf.buffer == expected.buffer
+
+def test_render_async():
+    import asyncio
+
+    framebuf = FrameBuffer(bytearray(128 * 64 // 8), 128, 64, MONO_VLSB)
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.create_task(ticker())
+        children = [inline(ComputedStyle(font=Font8()), [f'{i}']) for i in range(8)]
+        rects = await render.render_async(children, framebuf, nodes=2)
+        task.cancel()
+        return rects
+
+    assert asyncio.run(main()) == [Rect(0, 0, 8, 64)]
+    assert len(ticks) > 2
@@ -0,0 +1,166 @@
+from decal import (
+    Decal,
+    DisplayList,
+    ComputedStyle,
+    Color,
+    BorderStyle,
+    BitMap,
+    Viewport,
+    Position,
+    Dimensions,
+    Rect,
+    Percentage,
+    BoxSizing,
+    InstrumentedFrameBuffer,
+    display_list,
+    cached_display_list,
+    draw,
+    block,
+    inline,
+    virtual_list)
+from decal.framebuffer import FrameBuffer, RGB565
+from helpers import Font8
+
+item_style = ComputedStyle.shorthand(font=Font8(), padding=2, border=(1, BorderStyle.SOLID, 0x07e0))
+selected_style = ComputedStyle.shorthand(font=Font8(), padding=2, border=(1, BorderStyle.SOLID, Color.WHITE),
+    foreground_color=0xf800)
+
+def screen(selected, scroll=0):
+    return block([
+        inline(item_style, ['title', BitMap(bytes([0x00, 0x08, 0x1c, 0x3e, 0x7f, 0x7f, 0x7f, 0x7f]))]),
+        virtual_list(None, 20, 12, lambda i: inline(selected_style if i == selected else item_style, [f'row {i}']),
+            40, scroll)
+    ])
+
+def framebuffer():
+    framebuf = FrameBuffer(bytearray(96 * 64 * 2), 96, 64, RGB565)
+    framebuf.fill(0x001f)
+    return framebuf
+
+def drawn(viewport, clip=None):
+    framebuf = framebuffer()
+    draw(viewport, framebuf, clip)
+    return framebuf.buffer
+
+def replayed(display, clip=None):
+    framebuf = framebuffer()
+    display.replay(framebuf, clip)
+    return framebuf.buffer
+
+def test_display_list_replay():
+    viewport = Viewport(Position(0, 0), Dimensions(96, 48), [screen(1, 5)])
+    viewport.layout()
+    display = display_list(viewport)
+
+    assert isinstance(display, DisplayList)
+    assert replayed(display) == drawn(viewport)
+    assert replayed(display, Rect(10, 10, 30, 30)) == drawn(viewport, Rect(10, 10, 30, 30))
+
+def test_display_list_update():
+    viewport = Viewport(Position(0, 0), Dimensions(96, 48), [])
+    render = Decal(viewport)
+    list(render(screen(0)))
+    display = display_list(viewport)
+    ops = display.ops
+
+    for selected in (1, 2):
+        display.update(viewport, list(render(screen(selected))))
+
+        assert replayed(display) == drawn(viewport)
+
+    # Changed rows are patched in place
+    assert display.ops is ops
+
+    for selected, scroll in ((2, 7), (3, 20), (3, 0)):
+        display.update(viewport, list(render(screen(selected, scroll))))
+
+        assert replayed(display) == drawn(viewport)
+
+def test_display_list_moved_list():
+    def header(height):
+        return block([
+            inline(ComputedStyle.shorthand(font=Font8(), height=height), ['title']),
+            virtual_list(None, 20, 12, lambda i: inline(item_style, [f'row {i}']), 24)
+        ])
+
+    viewport = Viewport(Position(0, 0), Dimensions(96, 48), [])
+    render = Decal(viewport)
+    list(render(header(8)))
+    display = display_list(viewport)
+
+    # The list is moved down along with its rows
+    for height in (16, 4):
+        display.update(viewport, list(render(header(height))))
+
+        assert replayed(display) == drawn(viewport)
+
+def test_display_list_patch_empty():
+    def rows(color, padding):
+        return block(ComputedStyle.shorthand(padding=padding), [
+            inline(ComputedStyle.shorthand(font=Font8(), foreground_color=color), ['a']),
+            inline(ComputedStyle.shorthand(font=Font8(), foreground_color=Color.WHITE), ['b'])
+        ])
+
+    viewport = Viewport(Position(0, 0), Dimensions(96, 48), [])
+    render = Decal(viewport)
+    list(render(rows(Color.TRANSPARENT, 0)))
+    display = display_list(viewport)
+
+    # The first row draws nothing before it is patched, its parent encloses it
+    for color, padding in ((Color.WHITE, 0), (Color.WHITE, 4), (Color.TRANSPARENT, 4), (0xf800, 2)):
+        display.update(viewport, list(render(rows(color, padding))))
+        compiled = display_list(viewport)
+
+        assert display.ranges == compiled.ranges
+        assert display.ops == compiled.ops
+        assert replayed(display) == drawn(viewport)
+
+def test_display_list_duplicate_keys():
+    def rows(color):
+        return block([
+            inline(ComputedStyle.shorthand(font=Font8(), foreground_color=color), ['one'], key='a'),
+            inline(ComputedStyle.shorthand(font=Font8(), foreground_color=Color.WHITE), ['two'], key='a')
+        ])
+
+    viewport = Viewport(Position(0, 0), Dimensions(96, 48), [])
+    render = Decal(viewport)
+    list(render(rows(Color.WHITE)))
+    display = display_list(viewport)
+
+    # The first row shares its path with the second one and is not patched in its place
+    display.update(viewport, list(render(rows(0xf800))))
+
+    assert replayed(display) == drawn(viewport)
+
+def test_cached_display_list():
+    viewport = Viewport(Position(0, 0), Dimensions(96, 48), [screen(0)])
+    viewport.layout()
+
+    assert cached_display_list('menu', viewport) is cached_display_list('menu', viewport)
+
+def test_optimized_display_list():
+    row_style = ComputedStyle.shorthand(font=Font8(), padding=2, width=Percentage(100), box_sizing=BoxSizing.BORDER,
+        background_color=0x001f)
+    viewport = Viewport(Position(0, 0), Dimensions(96, 64), [
+        block(ComputedStyle.shorthand(background_color=Color.WHITE, border=(1, BorderStyle.SOLID, 0xf800)), [
+            inline(row_style, [f'row {i}']) for i in range(4)
+        ] + [inline(item_style, ['end'])])
+    ])
+    viewport.layout()
+    display = display_list(viewport)
+    optimized = display.optimized(background=0x001f)
+
+    for clip in (None, Rect(5, 5, 40, 30)):
+        framebuf = InstrumentedFrameBuffer(framebuffer())
+        display.replay(framebuf, clip)
+        expected = framebuf.target.buffer
+        calls = sum(framebuf.calls.values())
+
+        framebuf = InstrumentedFrameBuffer(framebuffer())
+        optimized.replay(framebuf, clip)
+
+        assert framebuf.target.buffer == expected
+        assert sum(framebuf.calls.values()) < calls
+
+    assert optimized.saved > 96 * 48
+    assert len(optimized) < len(display)
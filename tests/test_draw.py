@@ -1,7 +1,156 @@
-from decal import draw, ComputedStyle, BlockBox
+from decal import (
+    draw,
+    ComputedStyle,
+    Color,
+    Position,
+    Dimensions,
+    Rect,
+    Viewport,
+    BlockBox,
+    TextBox,
+    BitMap,
+    BitMapBox,
+    ScaledBitMap,
+    block,
+    inline)
+from decal.framebuffer import FrameBuffer, RGB565
+from helpers import Font8
+
+class Canvas:
+    def __init__(self):
+        self.pixels = {}
+        self.calls = 0
+
+    def pixel(self, x, y, c):
+        self.calls += 1
+        self.pixels[x, y] = c
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def text(self, s, x, y, c=1):
+        self.calls += 1
+
+    def fill_rect(self, x, y, w, h, c):
+        self.calls += 1
+
+        for i in range(x, x + w):
+            for j in range(y, y + h):
+                self.pixels[i, j] = c
+
+def bitmap_pixels(bitmap, style):
+    pixels = {}
+
+    for x, y, bit in bitmap:
+        pixel = style.foreground_color if bit else style.background_color
+
+        if pixel != Color.TRANSPARENT:
+            pixels[x, y] = pixel
+
+    return pixels
 
 def test_draw_block_box():
     box = BlockBox(ComputedStyle(), [])
 
     # Nothing raised
     draw(box, None)
+
+def test_draw_bitmap_box_spans():
+    icon = BitMap(bytes([0x00, 0x08, 0x1c, 0x3e, 0x7f, 0x7f, 0x7f, 0x7f]))
+
+    for bitmap in (icon, icon.scale(3)):
+        for style in (ComputedStyle(), ComputedStyle(background_color=Color.BLACK)):
+            canvas = Canvas()
+            draw(BitMapBox(style, bitmap), canvas)
+
+            assert canvas.pixels == bitmap_pixels(bitmap, style)
+            assert canvas.calls < len(bitmap) // 4
+
+def test_draw_clip():
+    box = BlockBox(ComputedStyle(background_color=Color.WHITE), [
+        BitMapBox(ComputedStyle(background_color=Color.BLACK), BitMap(bytes([0xff] * 8)))
+    ])
+
+    box.dimensions = Dimensions(16, 8)
+    box.children[0].dimensions = Dimensions(8, 8)
+
+    canvas = Canvas()
+    draw(box, canvas, clip=Rect(4, 2, 8, 4))
+
+    assert set(canvas.pixels) == {(x, y) for x in range(4, 12) for y in range(2, 6)}
+    assert canvas.pixels[4, 2] == Color.WHITE
+    assert canvas.pixels[8, 2] == Color.WHITE
+
+def test_draw_bitmap_box_blit():
+    icon = BitMap(bytes([0x00, 0x08, 0x1c, 0x3e, 0x7f, 0x7f, 0x7f, 0x7f]))
+
+    for bitmap in (icon, icon.scale(3)):
+        for style in (ComputedStyle(), ComputedStyle(background_color=Color.BLACK),
+                ComputedStyle(foreground_color=Color.BLACK, background_color=Color.WHITE)):
+            framebuf = FrameBuffer(bytearray(64 * 64 * 2), 64, 64, RGB565)
+            framebuf.fill(7)
+            draw(BitMapBox(style, bitmap), framebuf)
+
+            pixels = bitmap_pixels(bitmap, style)
+
+            for x in range(64):
+                for y in range(64):
+                    assert framebuf.pixel(x, y) == pixels.get((x, y), 7)
+
+def test_draw_bitmap_box_oversized():
+    class CountingScaledBitMap(ScaledBitMap):
+        upscales = 0
+
+        def upscale(self):
+            CountingScaledBitMap.upscales += 1
+            return super().upscale()
+
+    # Too large for the caches, drawn from its runs without upscaling
+    bitmap = CountingScaledBitMap(BitMap(bytes([0x00, 0x08, 0x1c, 0x3e, 0x7f, 0x7f, 0x7f, 0x7f])), 32)
+    style = ComputedStyle(foreground_color=Color.BLACK, background_color=Color.WHITE)
+    framebuf = FrameBuffer(bytearray(256 * 256 * 2), 256, 256, RGB565)
+    framebuf.fill(7)
+    draw(BitMapBox(style, bitmap), framebuf)
+
+    assert CountingScaledBitMap.upscales == 0
+
+    pixels = bitmap_pixels(bitmap, style)
+
+    for x in range(0, 256, 4):
+        for y in range(0, 256, 4):
+            assert framebuf.pixel(x, y) == pixels[x, y]
+
+def test_draw_viewport_culling():
+    style = ComputedStyle(font=Font8(), background_color=Color.WHITE, foreground_color=Color.BLACK)
+    viewport = Viewport(Position(0, 0), Dimensions(128, 64), [
+        block([inline(style, [f'Item {i}']) for i in range(300)])
+    ])
+    viewport.layout()
+
+    canvas = Canvas()
+    draw(viewport, canvas)
+
+    # Eight visible rows, each with a background and a text
+    assert canvas.calls == 16
+    assert all(y < 64 for _, y in canvas.pixels)
+
+def test_draw_text_clip():
+    box = TextBox(ComputedStyle(font=Font8()), 'AB')
+    box.position = Position(3, 2)
+    box.dimensions = Dimensions(16, 8)
+    clip = Rect(6, 4, 8, 8)
+
+    whole = FrameBuffer(bytearray(32 * 32 * 2), 32, 32, RGB565)
+    draw(box, whole)
+
+    clipped = FrameBuffer(bytearray(32 * 32 * 2), 32, 32, RGB565)
+    draw(box, clipped, clip=clip)
+
+    canvas = Canvas()
+    draw(box, canvas, clip=clip)
+
+    expected = {(x, y) for x in range(6, 14) for y in range(4, 12) if whole.pixel(x, y)}
+
+    assert expected
+    assert {(x, y) for x in range(32) for y in range(32) if clipped.pixel(x, y)} == expected
+    assert set(canvas.pixels) == expected
@@ -0,0 +1,116 @@
+from decal import (
+    ComputedStyle,
+    Color,
+    BitMap,
+    Viewport,
+    Position,
+    Dimensions,
+    Rect,
+    InstrumentedFrameBuffer,
+    draw,
+    display_list,
+    block,
+    inline)
+from decal.draw import text_cache
+from decal.font import BitMapFont
+from decal.framebuffer import FrameBuffer, FONT_8X8, RGB565
+from helpers import Font8
+
+def framebuffer():
+    return FrameBuffer(bytearray(64 * 32 * 2), 64, 32, RGB565)
+
+def lit(framebuf):
+    return {(x, y): framebuf.pixel(x, y) for x in range(framebuf.width) for y in range(framebuf.height)
+        if framebuf.pixel(x, y)}
+
+def test_font_widths():
+    # Glyphs for ' ', '!' and '"' of width 2, 1 and 3
+    atlas = BitMap(bytes([0x00, 0x00, 0xff, 0x03, 0x00, 0x03]), width=6)
+    font = BitMapFont(atlas, [2, 1, 3], spacing=1)
+
+    assert font.width('!') == 2
+    assert font.width('" !') == 4 + 3 + 2
+    assert font.width('x') == font.width(' ')
+    assert font.height('!') == 8
+    assert font.glyphs[1] == BitMap(bytes([0xff]))
+    assert font.glyphs[2] == BitMap(bytes([0x03, 0x00, 0x03]))
+
+def test_font_matches_built_in():
+    font = BitMapFont(BitMap(FONT_8X8), [8] * 96, default='\x7f')
+
+    for clip in (None, Rect(5, 3, 30, 4)):
+        expected = framebuffer()
+        framebuf = framebuffer()
+
+        viewport = Viewport(Position(0, 0), Dimensions(64, 32), [
+            block([inline(ComputedStyle(font=font, foreground_color=0xf800), ['Hi, \x01A'])])
+        ])
+        viewport.layout()
+        expected.text('Hi, \x01A', 0, 0, 0xf800)
+
+        if clip is not None:
+            expected.fill_rect(0, 0, 64, clip.y, 0)
+            expected.fill_rect(0, clip.y + clip.height, 64, 32, 0)
+            expected.fill_rect(0, 0, clip.x, 32, 0)
+            expected.fill_rect(clip.x + clip.width, 0, 64, 32, 0)
+
+        draw(viewport, framebuf, clip)
+
+        assert viewport.children[0].height == 8
+        assert lit(framebuf) == lit(expected)
+
+        replayed = framebuffer()
+        display_list(viewport).replay(replayed, clip)
+
+        assert lit(replayed) == lit(expected)
+
+def test_font_without_blit():
+    class Canvas:
+        def __init__(self):
+            self.pixels = {}
+
+        def hline(self, x, y, w, c):
+            for i in range(x, x + w):
+                self.pixels[i, y] = c
+
+        def fill_rect(self, x, y, w, h, c):
+            for j in range(y, y + h):
+                self.hline(x, j, w, c)
+
+    font = BitMapFont(BitMap(FONT_8X8), [8] * 96)
+    canvas = Canvas()
+    font.text(canvas, 'ok', 2, 1, Color.WHITE)
+
+    expected = framebuffer()
+    expected.text('ok', 2, 1, Color.WHITE)
+
+    assert canvas.pixels == lit(expected)
+
+def test_text_cache():
+    font = BitMapFont(BitMap(FONT_8X8), [8] * 96)
+    viewport = Viewport(Position(0, 0), Dimensions(64, 32), [
+        block([
+            inline(ComputedStyle(font=font, foreground_color=0xf800), ['cached']),
+            inline(ComputedStyle(font=Font8(), foreground_color=Color.WHITE), ['built-in'])
+        ])
+    ])
+    viewport.layout()
+
+    expected = framebuffer()
+    draw(viewport, expected)
+
+    text_cache.resize(1024)
+
+    try:
+        for hits in (0, 2):
+            framebuf = InstrumentedFrameBuffer(framebuffer())
+            draw(viewport, framebuf)
+
+            assert framebuf.target.buffer == expected.buffer
+            assert framebuf.calls == {'blit': 2}
+            assert text_cache.hits == hits
+    finally:
+        text_cache.resize(0)
+        text_cache.clear()
+
+    assert text_cache.hit_rate() == 0
@@ -0,0 +1,126 @@
+import pytest
+
+from decal.framebuffer import FrameBuffer, MONO_VLSB, MONO_HLSB, RGB565, FONT_8X8
+
+FORMATS = (MONO_VLSB, MONO_HLSB, RGB565)
+
+def framebuffer(width, height, format):
+    return FrameBuffer(bytearray(width * height * 2), width, height, format)
+
+def lit(framebuf):
+    return {(x, y) for x in range(framebuf.width) for y in range(framebuf.height) if framebuf.pixel(x, y)}
+
+def test_fill_rect():
+    for format in FORMATS:
+        framebuf = framebuffer(21, 19, format)
+        framebuf.fill_rect(-3, 3, 14, 11, 1)
+        framebuf.fill_rect(2, 5, 4, 2, 0)
+        framebuf.fill_rect(15, 17, 10, 10, 1)
+
+        expected = {(x, y) for x in range(0, 11) for y in range(3, 14)}
+        expected -= {(x, y) for x in range(2, 6) for y in range(5, 7)}
+        expected |= {(x, y) for x in range(15, 21) for y in range(17, 19)}
+
+        assert lit(framebuf) == expected
+
+def test_pixel():
+    framebuf = framebuffer(8, 8, RGB565)
+    framebuf.pixel(3, 4, 0xf81f)
+
+    assert framebuf.pixel(3, 4) == 0xf81f
+    assert framebuf.buffer[(4 * 8 + 3) * 2:(4 * 8 + 3) * 2 + 2] == b'\x1f\xf8'
+    assert framebuf.pixel(8, 0) is None
+
+def test_text():
+    for format in FORMATS:
+        framebuf = framebuffer(20, 12, format)
+        framebuf.text('A\x01', 2, 3, 1)
+
+        glyphs = {ord('A'): 2, 127: 10}
+        expected = set()
+
+        for code, x in glyphs.items():
+            for i in range(8):
+                for j in range(8):
+                    if FONT_8X8[(code - 32) * 8 + i] >> j & 1 and 3 + j < 12:
+                        expected.add((x + i, 3 + j))
+
+        assert lit(framebuf) == expected
+
+def test_blit():
+    source = framebuffer(4, 4, MONO_VLSB)
+    source.fill_rect(1, 1, 2, 2, 1)
+
+    palette = framebuffer(2, 1, RGB565)
+    palette.pixel(0, 0, 0x1234)
+    palette.pixel(1, 0, 0xffff)
+
+    for format in FORMATS:
+        framebuf = framebuffer(8, 8, format)
+        framebuf.fill(1)
+        framebuf.blit(source, 5, -1, 1)
+
+        assert lit(framebuf) == {(x, y) for x in range(8) for y in range(8)} - {(5, 0), (5, 1), (5, 2), (6, 2), (7, 2)}
+
+    framebuf = framebuffer(8, 8, RGB565)
+    framebuf.blit(source, 0, 0, 0xffff, palette)
+
+    assert framebuf.pixel(0, 0) == 0x1234
+    assert framebuf.pixel(1, 1) == 0
+    assert framebuf.pixel(4, 0) == 0
+
+def test_scroll():
+    for format in FORMATS:
+        framebuf = framebuffer(16, 16, format)
+        framebuf.fill_rect(0, 0, 2, 2, 1)
+        framebuf.scroll(3, 9)
+
+        assert lit(framebuf) == {(0, 0), (1, 0), (0, 1), (1, 1), (3, 9), (4, 9), (3, 10), (4, 10)}
+
+def test_export():
+    framebuf = framebuffer(10, 2, MONO_HLSB)
+    framebuf.pixel(0, 0, 1)
+
+    assert framebuf.pbm() == b'P4\n10 2\n\x7f\xc0\xff\xc0'
+    assert framebuf.bmp()[:2] == b'BM'
+    assert len(framebuf.bmp()) == 14 + 40 + 8 + 2 * 4
+
+def python_framebuffer(width, height, format):
+    # Same frame buffer without the NumPy backend
+    framebuf = framebuffer(width, height, format)
+    framebuf.array = None
+    return framebuf
+
+def pattern(framebuf, seed):
+    for y in range(framebuf.height):
+        for x in range(framebuf.width):
+            value = (x * 7 + y * 13 + seed) * 2654435761 >> 7
+
+            if framebuf.format != RGB565:
+                value &= 1
+
+            framebuf.pixel(x, y, value & 0xffff)
+
+def test_numpy_matches_python():
+    pytest.importorskip('numpy')
+
+    palette = framebuffer(2, 1, RGB565)
+    palette.pixel(0, 0, 0x1234)
+    palette.pixel(1, 0, 0xffff)
+
+    for source_format in FORMATS:
+        for format in FORMATS:
+            for key, colors in ((-1, None), (0, None), (1, None), (0x1234, palette)):
+                buffers = []
+
+                for create in (framebuffer, python_framebuffer):
+                    source = create(11, 9, source_format)
+                    pattern(source, 1)
+                    framebuf = create(21, 19, format)
+                    pattern(framebuf, 2)
+                    framebuf.blit(source, 3, -2, key, colors)
+                    framebuf.blit(source, 15, 13, key, colors)
+                    framebuf.scroll_rect(2, 3, 15, 11, -3, 5)
+                    buffers.append((bytes(framebuf.buffer), framebuf.pbm(), framebuf.bmp()))
+
+                assert buffers[0] == buffers[1], (source_format, format, key)
@@ -1,4 +1,20 @@
-from decal import ComputedStyle, Box
+import pytest
+
+from decal import (
+    ComputedStyle,
+    BorderStyle,
+    Color,
+    Box,
+    BlockBox,
+    TextBox,
+    BitMap,
+    BitMapBox,
+    Viewport,
+    Position,
+    Dimensions,
+    Rect)
+from decal.layout import measure_cache, bitmap_cache
+from helpers import Font8
 
 def test_default_box():
     box = Box(ComputedStyle())
@@ -9,3 +25,147 @@ def test_default_box():
     assert box.height == 0
     assert box.left_offset == 0
     assert box.top_offset == 0
+
+def test_scaled_bitmap_pack():
+    bitmap = BitMap(bytes([0x01, 0x82, 0xff]), width=3).scale(2)
+    packed = bitmap.pack()
+
+    assert (packed.width, packed.height) == (bitmap.width, bitmap.height)
+    assert list(packed) == list(bitmap)
+
+def test_scaled_bitmap_pack_large():
+    # 256 x 256 pixels do not fit into the 4096 bytes of bitmap_cache
+    bitmap = BitMap(bytes([0x01, 0x82, 0xff, 0x00] * 2), width=8).scale(32)
+    entries = len(bitmap_cache)
+    packed = bitmap.pack()
+
+    assert packed.length > bitmap_cache.capacity
+    assert bitmap.oversized()
+    assert bitmap.pack() is not packed
+    assert len(bitmap_cache) == entries
+    assert hash(bitmap) == hash(packed)
+    assert bitmap == packed
+
+def test_scaled_bitmap_collapse():
+    bitmap = BitMap(bytes([0x01, 0x82, 0xff]), width=3)
+    nested = bitmap.scale(2).scale(3)
+
+    assert nested.bitmap is bitmap
+    assert nested.ratio == 6
+    assert nested == bitmap.scale(6)
+    assert nested == nested.pack()
+    assert hash(nested) == hash(nested.pack())
+
+def test_incremental_layout():
+    class CountingTextBox(TextBox):
+        reflows = 0
+
+        def reflow(self, parent):
+            CountingTextBox.reflows += 1
+            super().reflow(parent)
+
+    font = ComputedStyle(font=Font8())
+    first = TextBox(font, 'a')
+    second = CountingTextBox(font, 'b')
+    viewport = Viewport(Position(0, 0), Dimensions(64, 64), [BlockBox(ComputedStyle(), [first, second])])
+    viewport.layout()
+
+    # Clean boxes are only moved after the preceding sibling changed height
+    first.text = 'a\nb'
+    viewport.layout()
+
+    assert not first.dirty and not second.dirty
+    assert CountingTextBox.reflows == 1
+    assert first.dimensions == Dimensions(8, 16)
+    assert second.position == Position(0, 16)
+
+def test_measure_batch():
+    class BatchFont(Font8):
+        def measure(self, texts):
+            self.batches.append(sorted(texts))
+            return [(self.width(text), self.height(text)) for text in texts]
+
+    font = BatchFont()
+    font.batches = []
+    style = ComputedStyle(font=font)
+    viewport = Viewport(Position(0, 0), Dimensions(64, 64), [
+        BlockBox(ComputedStyle(), [TextBox(style, 'ab'), TextBox(style, 'cd'), TextBox(style, 'ab')])
+    ])
+
+    measure_cache.clear()
+    viewport.layout()
+
+    assert font.batches == [['ab', 'cd']]
+    assert viewport.children[0].children[1].dimensions == Dimensions(16, 8)
+    assert (measure_cache.hits, measure_cache.misses) == (6, 0)
+
+    class UnhashableFont(BatchFont):
+        __hash__ = None
+
+    # Fonts which can not be cached are measured text by text
+    font = UnhashableFont()
+    font.batches = []
+    viewport.children = [BlockBox(ComputedStyle(), [TextBox(ComputedStyle(font=font), 'ab')])]
+    viewport.layout()
+
+    assert font.batches == []
+    assert viewport.children[0].children[0].dimensions == Dimensions(16, 8)
+
+def test_style_interned():
+    a = ComputedStyle.shorthand(padding=2, border=(1, BorderStyle.SOLID, Color.WHITE))
+    b = ComputedStyle.shorthand(padding=2, border=(1, BorderStyle.SOLID, Color.WHITE))
+
+    assert a is b
+    assert a != ComputedStyle.shorthand(padding=3)
+    assert (a.left_offset, a.horizontal, a.inset_vertical) == (3, 6, 6)
+
+    with pytest.raises(AttributeError):
+        a.padding_top = 0
+
+def test_content_hash():
+    style = ComputedStyle.shorthand(font=Font8())
+    a = BlockBox(style, [TextBox(style, 'a'), TextBox(style, 'b')])
+    b = BlockBox(style, [TextBox(style, 'a'), TextBox(style, 'b')])
+
+    assert a.content_hash() == b.content_hash()
+    assert a == b
+
+    # Assigning content clears the cached hashes of the box and its ancestors
+    b.children[1].text = 'c'
+
+    assert b.cached_hash is None
+    assert a.content_hash() != b.content_hash()
+    assert a != b
+
+    b.children[1].text = 'b'
+    assert a.content_hash() == b.content_hash()
+
+    b.children[0].style = ComputedStyle.shorthand(font=Font8(), padding=1)
+    assert a.content_hash() != b.content_hash()
+
+    b.children[0].style = style
+    b.children = [TextBox(style, 'a')]
+    assert b.children[0].parent is b
+    assert a.content_hash() != b.content_hash()
+
+    icon = BitMap(bytes([0xff]))
+    c = BitMapBox(style, icon)
+    d = BlockBox(style, [c])
+    before = d.content_hash()
+    c.bitmap = BitMap(bytes([0x0f]))
+
+    assert d.content_hash() != before
+
+    # Changes in place still need invalidate()
+    b.children.append(TextBox(style, 'b'))
+    b.children[1].parent = b
+    b.invalidate()
+    assert a.content_hash() == b.content_hash()
+
+def test_rect_subtract():
+    rect = Rect(0, 0, 10, 10)
+
+    assert rect.subtract(Rect(20, 20, 5, 5)) == [rect]
+    assert rect.subtract(Rect(-5, -5, 20, 20)) == []
+    assert rect.subtract(Rect(0, 0, 10, 4)) == [Rect(0, 4, 10, 6)]
+    assert sum(part.area() for part in rect.subtract(Rect(2, 3, 4, 5))) == 100 - 20
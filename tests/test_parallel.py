@@ -0,0 +1,41 @@
+from decal import (
+    Viewport,
+    Position,
+    Dimensions,
+    draw)
+from decal.framebuffer import FrameBuffer, MONO_VLSB, RGB565
+from decal.parallel import ParallelRenderer
+from helpers import screen
+
+def screen_viewport(values):
+    return Viewport(Position(0, 0), Dimensions(64, 48), [screen(values)])
+
+def expected(viewport, format):
+    viewport.layout()
+    framebuf = FrameBuffer(bytearray(64 * 48 * 2 if format == RGB565 else 64 * 48 // 8), 64, 48, format)
+    draw(viewport, framebuf)
+    return framebuf.buffer
+
+def test_tiles():
+    with ParallelRenderer(4, tile_width=24, tile_height=16) as renderer:
+        assert renderer.processes
+        viewport = screen_viewport([1, 22, 333])
+        viewport.layout()
+
+        assert renderer.render(viewport).buffer == expected(viewport, RGB565)
+
+    with ParallelRenderer(2, processes=False, tile_width=40, tile_height=8, format=MONO_VLSB) as renderer:
+        assert not renderer.processes
+
+        viewport = screen_viewport([4, 55])
+        viewport.layout()
+
+        assert renderer.render(viewport).buffer == expected(viewport, MONO_VLSB)
+
+def test_render_many():
+    values = [[i, i * 11] for i in range(6)]
+
+    with ParallelRenderer(2) as renderer:
+        framebufs = list(renderer.render_many([screen_viewport(value) for value in values], chunksize=2))
+
+    assert [framebuf.buffer for framebuf in framebufs] == [expected(screen_viewport(value), RGB565) for value in values]
@@ -0,0 +1,103 @@
+from decal import (
+    Decal,
+    Profiler,
+    InstrumentedFrameBuffer,
+    ComputedStyle,
+    Color,
+    BitMap,
+    Viewport,
+    Position,
+    Dimensions,
+    draw,
+    block,
+    inline,
+    bitmap)
+from decal import profile
+from decal.framebuffer import FrameBuffer, MONO_VLSB
+from helpers import Font8
+
+def test_instrumented_framebuffer():
+    target = FrameBuffer(bytearray(32 * 32 // 8), 32, 32, MONO_VLSB)
+    framebuf = InstrumentedFrameBuffer(target)
+
+    framebuf.fill_rect(0, 0, 4, 2, 1)
+    framebuf.fill_rect(0, 4, 2, 2, 1)
+    framebuf.text('ab', 0, 8)
+
+    stats = framebuf.stats()
+
+    assert stats['fill_rect'][0] == 2
+    assert stats['fill_rect'][2] == 12
+    assert stats['text'][0] == 1
+    assert stats['text'][2] == 128
+    assert framebuf.pixel(1, 1) == 1
+    assert framebuf.width == 32
+
+    # Only pixels within the frame buffer are counted
+    framebuf.reset()
+    framebuf.hline(-4, 0, 8, 1)
+    framebuf.vline(0, 30, 8, 1)
+    framebuf.fill_rect(40, 0, 4, 4, 1)
+    framebuf.rect(-1, -1, 4, 4, 1)
+    framebuf.text('abcde', 16, 28)
+    framebuf.pixel(32, 0, 1)
+
+    stats = framebuf.stats()
+
+    assert stats['hline'][2] == 4
+    assert stats['vline'][2] == 2
+    assert stats['fill_rect'] == (1, stats['fill_rect'][1], 0)
+    assert stats['rect'][2] == 5
+    assert stats['text'][2] == 2 * 8 * 4
+    assert stats['pixel'][2] == 0
+
+class Bare:
+    # Frame buffer without dimensions like the built-in framebuf module
+    def __init__(self, framebuf):
+        self.framebuf = framebuf
+
+    def fill(self, c):
+        self.framebuf.fill(c)
+
+    def blit(self, fbuf, x, y, key=-1):
+        self.framebuf.blit(getattr(fbuf, 'framebuf', fbuf), x, y, key)
+
+def test_instrumented_framebuffer_dimensions():
+    source = FrameBuffer(bytearray(8), 8, 8, MONO_VLSB)
+    framebuf = InstrumentedFrameBuffer(Bare(FrameBuffer(bytearray(32 * 32 // 8), 32, 32, MONO_VLSB)), 32, 32)
+
+    framebuf.fill(0)
+    framebuf.blit(source, 28, -2)
+    framebuf.blit(Bare(source), 0, 0)
+
+    stats = framebuf.stats()
+
+    assert stats['fill'][2] == 32 * 32
+    assert stats['blit'][0] == 2
+    assert stats['blit'][2] == 4 * 6
+
+def test_profile_frame():
+    framebuf = InstrumentedFrameBuffer(FrameBuffer(bytearray(64 * 64 // 8), 64, 64, MONO_VLSB))
+    records = []
+    profiler = profile.enable(Profiler(records.append, framebuf))
+
+    try:
+        viewport = Viewport(Position(0, 0), Dimensions(64, 64), [])
+        render = Decal(viewport)
+        list(render(block([
+            inline(ComputedStyle(font=Font8(), background_color=Color.WHITE), ['hello']),
+            bitmap(BitMap(bytes([0xff] * 8)))
+        ])))
+        draw(viewport, framebuf)
+        record = profiler.frame()
+    finally:
+        profile.disable()
+
+    assert records == [record]
+    assert set(record) == {'layout', 'diff', 'draw', 'framebuf'}
+    assert record['framebuf']['blit'][0] == 1
+    assert framebuf.stats() == {}
+
+    draw(viewport, framebuf)
+
+    assert profiler.record == {}
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+from decal import (
+    Decal,
+    Scheduler,
+    ComputedStyle,
+    Viewport,
+    Position,
+    Dimensions,
+    inline)
+from decal.framebuffer import FrameBuffer, MONO_VLSB
+from helpers import Font8
+
+def label(text):
+    return inline(ComputedStyle(font=Font8()), [text])
+
+def scheduler(**kwargs):
+    framebuf = FrameBuffer(bytearray(64 * 16 // 8), 64, 16, MONO_VLSB)
+    rendered = []
+    decal = Decal(Viewport(Position(0, 0), Dimensions(64, 16), []))
+    schedule = Scheduler(decal, framebuf, flush=lambda fb, rects: rendered.append(decal.viewport.children[0]),
+        **kwargs)
+    return schedule, rendered
+
+def test_coalesce():
+    schedule, rendered = scheduler(fps=10)
+
+    assert schedule.poll(0) is None
+
+    schedule.submit(label('a'))
+    assert schedule.poll(0) is not None
+
+    # Only the latest tree is rendered once the frame interval passed
+    schedule.submit(label('b'))
+    schedule.submit(label('c'))
+
+    assert schedule.delay(50000) == 50000
+    assert schedule.poll(50000) is None
+    assert schedule.poll(100000) is not None
+    assert [box.children[0].text for box in rendered] == ['a', 'c']
+    assert schedule.stats()['frames'] == 2
+    assert schedule.stats()['dropped'] == 1
+    assert schedule.max_latency >= schedule.latency >= 0
+
+def test_wait():
+    schedule, rendered = scheduler(wait=True)
+
+    schedule.submit(label('a'))
+    schedule.poll()
+    schedule.submit(label('b'))
+
+    assert schedule.delay() is None
+    assert schedule.poll() is None
+
+    schedule.ready()
+
+    assert schedule.poll() is not None
+    assert len(rendered) == 2
+
+def test_thread():
+    schedule, rendered = scheduler(fps=1000)
+    thread = threading.Thread(target=schedule.run)
+    thread.start()
+
+    for text in 'abc':
+        schedule.submit(label(text))
+
+    while schedule.pending is not None:
+        pass
+
+    schedule.stop()
+    thread.join()
+
+    assert rendered[-1].children[0].text == 'c'
+    assert schedule.frames + schedule.dropped == 3
+
+def test_thread_waits():
+    schedule, rendered = scheduler(fps=20)
+    checks = []
+    delay = schedule.delay
+
+    def counted(now=None):
+        checks.append(now)
+        return delay(now)
+
+    schedule.delay = counted
+    thread = threading.Thread(target=schedule.run)
+    thread.start()
+
+    # Idle and rate limited periods are slept through instead of polled
+    time.sleep(0.05)
+    schedule.submit(label('b'))
+    time.sleep(0.01)
+    schedule.submit(label('c'))
+    time.sleep(0.1)
+    schedule.stop()
+    thread.join()
+
+    assert [box.children[0].text for box in rendered] == ['b', 'c']
+    assert len(checks) < 20
+
+def test_serve():
+    schedule, rendered = scheduler()
+
+    async def main():
+        task = asyncio.create_task(schedule.serve())
+        await asyncio.sleep(0)
+        schedule.submit(label('a'))
+        schedule.submit(label('b'))
+
+        while schedule.pending is not None:
+            await asyncio.sleep(0)
+
+        schedule.stop()
+        await task
+
+    asyncio.run(main())
+
+    assert [box.children[0].text for box in rendered] == ['b']
+    assert schedule.dropped == 1
+
+def test_serve_thread_safe_flag(monkeypatch):
+    class ThreadSafeFlag:
+        # Stands in for MicroPython's flag, which interrupts may set
+        sets = 0
+
+        def __init__(self):
+            self.event = asyncio.Event()
+
+        def set(self):
+            ThreadSafeFlag.sets += 1
+            self.event.set()
+
+        def clear(self):
+            self.event.clear()
+
+        async def wait(self):
+            await self.event.wait()
+            self.event.clear()
+
+    monkeypatch.setattr(asyncio, 'ThreadSafeFlag', ThreadSafeFlag, raising=False)
+    schedule, rendered = scheduler(wait=True)
+
+    async def main():
+        task = asyncio.create_task(schedule.serve())
+        await asyncio.sleep(0)
+
+        # The flag is set directly, not scheduled on the loop
+        assert isinstance(schedule.event, ThreadSafeFlag) and schedule.loop is None
+
+        schedule.submit(label('a'))
+
+        while schedule.pending is not None:
+            await asyncio.sleep(0)
+
+        schedule.submit(label('b'))
+        sets = ThreadSafeFlag.sets
+        schedule.ready()
+
+        assert ThreadSafeFlag.sets == sets + 1
+
+        while schedule.pending is not None:
+            await asyncio.sleep(0)
+
+        schedule.stop()
+        await task
+
+    asyncio.run(main())
+
+    assert [box.children[0].text for box in rendered] == ['a', 'b']
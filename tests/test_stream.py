@@ -0,0 +1,64 @@
+from decal import regions, Decal, Rect, ComputedStyle, Viewport, Position, Dimensions, BlockBox, block, inline
+from decal.framebuffer import MONO_VLSB, MONO_HLSB, RGB565
+from helpers import Font8
+
+def test_vlsb_pages():
+    buffer = bytearray(range(128)) * 8
+    views = list(regions(buffer, 128, 64, MONO_VLSB, [Rect(3, 10, 5, 4), Rect(0, 60, 128, 10)]))
+
+    # Pages of partial rows, whole rows in one view
+    assert [window for view, *window in views] == [[3, 8, 5, 8], [0, 56, 128, 8]]
+    assert bytes(views[0][0]) == buffer[128 + 3:128 + 8]
+    assert len(views[1][0]) == 128
+
+    # Views share the buffer
+    buffer[128 + 3] = 255
+    assert views[0][0][0] == 255
+
+    views = list(regions(buffer, 128, 64, MONO_VLSB, [Rect(0, 4, 128, 20)]))
+
+    assert [window for view, *window in views] == [[0, 0, 128, 24]]
+    assert len(views[0][0]) == 3 * 128
+
+def test_rgb565_rows():
+    buffer = bytearray(range(256)) * 2
+    views = list(regions(buffer, 16, 16, RGB565, [Rect(2, 1, 4, 2)]))
+
+    assert [window for view, *window in views] == [[2, 1, 4, 1], [2, 2, 4, 1]]
+    assert bytes(views[1][0]) == buffer[2 * 32 + 4:2 * 32 + 12]
+
+def test_hlsb_columns():
+    buffer = bytearray(range(32))
+    views = list(regions(buffer, 16, 16, MONO_HLSB, [Rect(9, 3, 2, 2)]))
+
+    assert [window for view, *window in views] == [[8, 3, 8, 1], [8, 4, 8, 1]]
+    assert bytes(views[0][0]) == bytes([7])
+
+def test_boxes():
+    box = BlockBox(ComputedStyle(), [])
+    box.position = Position(0, 0)
+    box.dimensions = Dimensions(200, 8)
+
+    assert [window for view, *window in regions(bytearray(16 * 16 * 2), 16, 16, RGB565, [box])] == [[0, 0, 16, 8]]
+
+def test_updates():
+
+    def rows(keys):
+        return block([inline(ComputedStyle(font=Font8()), [f'row {key}'], key=key) for key in keys])
+
+    buffer = bytearray(128 * 64 // 8)
+    render = Decal(Viewport(Position(0, 0), Dimensions(128, 64), []))
+
+    assert [window for view, *window in regions(buffer, 128, 64, MONO_VLSB, render.update(rows([1, 2])))] == [
+        [0, 0, 128, 16]]
+
+    # Both the new and the old position of changed boxes, removed ones included
+    updates = render.update(rows([2]))
+
+    assert any(new is None for new, old in updates)
+    assert [window for view, *window in regions(buffer, 128, 64, MONO_VLSB, updates)] == [
+        [0, 0, 40, 8], [0, 8, 40, 8]]
+
+    updates = render.update(rows([2]), diff=False)
+
+    assert [window for view, *window in regions(buffer, 128, 64, MONO_VLSB, updates)] == [[0, 0, 128, 64]]